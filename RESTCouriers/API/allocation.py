@@ -0,0 +1,328 @@
+"""
+Solvers that choose which orders go into a courier's bag.
+
+Every solver takes free space and integer weights (hundredths of kilogram) and returns sorted indices of chosen
+weights. Exact solvers maximize the total weight and pick the same orders as the original table based knapsack.
+"""
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from . import metrics
+from .instrumentation import record_solve
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+pool = None
+pool_lock = threading.Lock()
+row_cache = None
+row_cache_lock = threading.Lock()
+
+
+class SolverTimeout(Exception):
+    """
+    Raised when exact solver could not finish before its deadline
+    """
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise SolverTimeout()
+
+
+def reconstruct(has_sum, weights, total):
+    """
+    Walks rows back from the last one. has_sum(k, s) tells if sum s is reachable with first k weights.
+    Order is skipped whenever the same sum is reachable without it, exactly as the table based backtrack did
+    """
+    taken = []
+    for k in range(len(weights), 0, -1):
+        if total == 0:
+            break
+        if not has_sum(k - 1, total):
+            taken.append(k - 1)
+            total -= weights[k - 1]
+    taken.reverse()
+    return taken
+
+
+def bitset_knapsack(space, weights, deadline=None):
+    """
+    Every row is an int whose bit s is set if sum s is reachable with first k weights, so a row costs
+    space / 8 bytes instead of a list of space python ints
+    """
+    if space <= 0:
+        return []
+    mask = (1 << (space + 1)) - 1
+    rows = [1]
+    for weight in weights:
+        check_deadline(deadline)
+        rows.append((rows[-1] | (rows[-1] << weight)) & mask)
+    return reconstruct(lambda k, s: rows[k] >> s & 1, weights, rows[-1].bit_length() - 1)
+
+
+class RowCache:
+    """
+    Reachability rows of the last problem of every scope, least recently used scopes are evicted when rows take more
+    than budget bytes. Cached rows are never changed, so readers don't hold the lock while they use them
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Rows needed by solved problems and the part of them taken from the cache
+        self.rows = 0
+        self.reused_rows = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, rows, reused_rows):
+        with self.lock:
+            self.rows += rows
+            self.reused_rows += reused_rows
+            if key in self.entries:
+                self.size -= self.entries.pop(key).size
+            if entry.size > self.budget:
+                return
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.budget:
+                self.size -= self.entries.popitem(last=False)[1].size
+
+
+class CachedRows:
+    """
+    Rows of keys (order_id, weight) sorted from the heaviest, row k is for first k keys. Every row is computed for sums
+    up to its width and is exact only up to the smallest width of rows before it, so widths never grow along rows
+    """
+    def __init__(self, keys, rows, widths):
+        self.keys = keys
+        self.rows = rows
+        self.widths = widths
+        # Rows are counted at the largest width, the first one
+        self.size = len(rows) * (sys.getsizeof((1 << (widths[0] + 1)) - 1) + 16) + len(keys) * 80
+
+    def fitting(self, space):
+        """
+        Index of the first key not heavier than space. Heavier orders before it change only sums above space, so row
+        of this index and the following ones hold for the keys after it
+        """
+        return self.bisect(lambda index: self.keys[index][1] > space, len(self.keys))
+
+    def exact(self, space):
+        """
+        Number of first rows exact for sums up to space
+        """
+        return self.bisect(lambda index: self.widths[index] >= space, len(self.widths))
+
+    @staticmethod
+    def bisect(before, length):
+        low, high = 0, length
+        while low < high:
+            middle = (low + high) // 2
+            if before(middle):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def get_row_cache():
+    global row_cache
+    with row_cache_lock:
+        if row_cache is None:
+            row_cache = RowCache(settings.KNAPSACK_CACHE_BYTES)
+        return row_cache
+
+
+def common_prefix(first, second):
+    """
+    Length of the longest common prefix of two sequences, slices are compared in C and the length is found by
+    bisection. Only the part after the known common prefix is compared, so about 2 * length items are compared
+    """
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def incremental_knapsack(scope, keys, space, weights, deadline=None):
+    """
+    The bitset knapsack that starts from rows cached for the last problem of scope, keys are (order_id, weight) sorted
+    from the heaviest like weights. Row k depends only on the first k weights and bits above space are never read, so
+    rows of the longest common prefix of keys computed for at least space are reused and only the rest is computed
+    """
+    if space <= 0:
+        return []
+    keys = tuple(keys)
+    cached = get_row_cache().get(scope)
+    start = cached.fitting(space) if cached is not None else 0
+    exact = cached.exact(space) if cached is not None else 0
+    if start < exact:
+        reused = common_prefix(keys, cached.keys[start:exact - 1])
+        row = cached.rows[start + reused]
+    else:
+        reused = 0
+        row = 1
+    mask = (1 << (space + 1)) - 1
+    computed = []
+    for weight in weights[reused:]:
+        if deadline is not None:
+            check_deadline(deadline)
+        row = (row | (row << weight)) & mask
+        computed.append(row)
+    if start < exact:
+        rows = cached.rows[start:start + reused + 1] + computed
+        stored = CachedRows(cached.keys[:start + reused] + keys[reused:], cached.rows[:start + reused + 1] + computed,
+                            cached.widths[:start + reused + 1] + [space] * len(computed))
+    else:
+        rows = [1] + computed
+        stored = CachedRows(keys, rows, [space] * len(rows))
+    get_row_cache().put(scope, stored, len(keys), reused)
+    return reconstruct(lambda k, s: rows[k] >> s & 1, weights, (rows[-1] & mask).bit_length() - 1)
+
+
+def numpy_knapsack(space, weights, deadline=None):
+    """
+    The same reachability rows computed with numpy boolean arrays and kept packed to bits
+    """
+    if numpy is None:
+        return bitset_knapsack(space, weights, deadline)
+    if space <= 0:
+        return []
+    reach = numpy.zeros(space + 1, dtype=bool)
+    reach[0] = True
+    rows = [numpy.packbits(reach)]
+    for weight in weights:
+        check_deadline(deadline)
+        if weight <= space:
+            previous = reach
+            reach = previous.copy()
+            reach[weight:] |= previous[:space + 1 - weight]
+        rows.append(numpy.packbits(reach))
+    return reconstruct(lambda k, s: rows[k][s >> 3] >> (7 - (s & 7)) & 1, weights,
+                       int(numpy.flatnonzero(reach)[-1]))
+
+
+def greedy_knapsack(space, weights, deadline=None):
+    """
+    Takes every order that still fits in the given order of weights
+    """
+    taken = []
+    for index, weight in enumerate(weights):
+        if weight <= space:
+            taken.append(index)
+            space -= weight
+    return taken
+
+
+def bounded_knapsack(space, weights, deadline=None):
+    """
+    Exact answer if it could be found in ALLOCATION_TIME_BUDGET seconds and greedy one otherwise
+    """
+    if deadline is None:
+        deadline = time.monotonic() + settings.ALLOCATION_TIME_BUDGET
+    try:
+        return bitset_knapsack(space, weights, deadline)
+    except SolverTimeout:
+        return greedy_knapsack(space, weights)
+
+
+SOLVERS = {
+    'bitset': bitset_knapsack,
+    'numpy': numpy_knapsack,
+    'greedy': greedy_knapsack,
+    'bounded': bounded_knapsack,
+}
+
+
+def solve(courier_type, space, weights, scope=None, keys=None):
+    """
+    Solves packing with the strategy configured for this type of courier in ALLOCATION_STRATEGIES. Big problems go to
+    the pool of solver processes and get greedy answer if they are not solved in SOLVER_DEADLINE seconds.
+    Callers that pass a hashable scope of the candidates and keys identifying every weight let exact solving in this
+    process reuse rows of the previous problem of the scope
+    """
+    started = time.perf_counter()
+    try:
+        strategy = settings.ALLOCATION_STRATEGIES.get(courier_type, 'bitset')
+        if scope is not None and settings.KNAPSACK_CACHE_BYTES > 0 and strategy in ('bitset', 'bounded') and \
+                not in_pool(space, weights):
+            return solve_incrementally(strategy, scope, keys, space, weights)
+        return solve_with_strategy(strategy, space, weights)
+    finally:
+        record_solve(time.perf_counter() - started)
+        metrics.observe_solve(len(weights), space, time.perf_counter() - started)
+
+
+def in_pool(space, weights):
+    return settings.SOLVER_POOL_SIZE != 0 and len(weights) * max(space, 0) >= settings.SOLVER_POOL_MIN_CELLS
+
+
+def solve_incrementally(strategy, scope, keys, space, weights):
+    if strategy == 'bitset':
+        return incremental_knapsack(scope, keys, space, weights)
+    try:
+        return incremental_knapsack(scope, keys, space, weights, time.monotonic() + settings.ALLOCATION_TIME_BUDGET)
+    except SolverTimeout:
+        return greedy_knapsack(space, weights)
+
+
+def solve_with_strategy(strategy, space, weights):
+    if not in_pool(space, weights):
+        return SOLVERS[strategy](space, weights)
+    try:
+        future = get_pool().submit(solve_in_worker, strategy, space, weights, settings.SOLVER_DEADLINE)
+        return future.result(timeout=settings.SOLVER_DEADLINE)
+    except (TimeoutError, SolverTimeout):
+        future.cancel()
+        logger.warning('Packing of %d orders in %d did not fit in deadline, greedy answer is used', len(weights),
+                       space)
+    except BrokenProcessPool:
+        reset_pool()
+        logger.exception('Solver pool is broken, greedy answer is used')
+    return greedy_knapsack(space, weights)
+
+
+def solve_in_worker(strategy, space, weights, timeout):
+    """
+    Runs in solver process, exact solvers stop at the deadline so the process is free for the next problem
+    """
+    return SOLVERS[strategy](space, weights, time.monotonic() + timeout)
+
+
+def get_pool():
+    global pool
+    with pool_lock:
+        if pool is None:
+            # Spawned processes don't inherit database connections and threads of the web worker
+            pool = ProcessPoolExecutor(max_workers=settings.SOLVER_POOL_SIZE,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        return pool
+
+
+def reset_pool():
+    global pool
+    with pool_lock:
+        if pool is not None:
+            pool.shutdown(wait=False)
+        pool = None
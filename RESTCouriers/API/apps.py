@@ -1,5 +1,31 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if settings.SHARED_CACHE:
+        return []
+    return [checks.Warning('Courier profiles are not cached and Idempotency-Key headers are ignored with a local '
+                           'memory cache',
+                           hint='Configure a cache shared by all workers or set SINGLE_PROCESS=1 for a single process',
+                           id='API.W001')]
+
+
+def check_allocation_strategies(app_configs, **kwargs):
+    from . import allocation
+    if allocation.numpy is not None:
+        return []
+    return [checks.Warning('numpy is not installed, bitset strategy is used instead of numpy for {0} couriers'.format(
+                               courier_type),
+                           hint='Install numpy or set ALLOCATION_{0} to bitset'.format(courier_type.upper()),
+                           id='API.W002')
+            for courier_type, strategy in settings.ALLOCATION_STRATEGIES.items() if strategy == 'numpy']
 
 
 class ApiConfig(AppConfig):
     name = 'API'
+
+    def ready(self):
+        checks.register(check_shared_cache)
+        checks.register(check_allocation_strategies)
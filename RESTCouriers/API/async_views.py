@@ -0,0 +1,130 @@
+"""
+Async variants of API views for ASGI servers.
+
+Every request is handed to a bounded pool of threads that do database and packing work, each thread keeps its own
+database connection so the pool is also a pool of connections. The event loop is left only with reading requests and
+writing responses. Streamed responses are made by a task of the same pool and awaited part by part by ASGIHandler of
+this module, the stock handler of Django 3.1 would iterate them on the event loop.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import close_old_connections
+from . import views
+
+# Parts of streamed response made ahead of sending
+PREFETCH = 2
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=settings.ASYNC_POOL_SIZE, thread_name_prefix='api')
+    return executor
+
+
+def run(view, request, *args, **kwargs):
+    # Connections of pool threads are not managed by request signals, so they are checked here
+    close_old_connections()
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def from_pool(content):
+    """
+    Async iterator over streamed content made by one task of the pool, the task keeps server side cursor of an export
+    and the connection of its thread until the end and stays at most PREFETCH parts ahead
+    """
+    loop = asyncio.get_running_loop()
+    parts = asyncio.Queue()
+    room = threading.Semaphore(PREFETCH)
+    stopped = threading.Event()
+    end = object()
+
+    def produce():
+        iterator = iter(content)
+        try:
+            for part in iterator:
+                room.acquire()
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(parts.put_nowait, (part, None))
+        except Exception as error:
+            loop.call_soon_threadsafe(parts.put_nowait, (end, error))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            close_old_connections()
+            loop.call_soon_threadsafe(parts.put_nowait, (end, None))
+
+    task = loop.run_in_executor(get_executor(), produce)
+    try:
+        while True:
+            part, error = await parts.get()
+            room.release()
+            if error is not None:
+                raise error
+            if part is end:
+                break
+            yield part
+    finally:
+        # Client that went away stops the task at the next part
+        stopped.set()
+        room.release()
+        await task
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Sends streamed responses of async views by awaiting their parts instead of iterating them on the event loop
+    """
+    async def send_response(self, response, send):
+        content = getattr(response, 'async_streaming_content', None)
+        if content is None:
+            return await super().send_response(response, send)
+        response_headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        response_headers.extend((b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                                for cookie in response.cookies.values())
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+        try:
+            async for part in content:
+                for chunk, _ in self.chunk_bytes(response.make_bytes(part)):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await content.aclose()
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def in_pool(view):
+    """
+    Turns sync view to async one that runs it in the pool
+    """
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        # Context goes with the request so the thread reports its queries to the instrumentation of this request
+        context = contextvars.copy_context()
+        response = await asyncio.get_running_loop().run_in_executor(
+            get_executor(), partial(context.run, run, view, request, *args, **kwargs))
+        if response.streaming:
+            response.async_streaming_content = from_pool(response.streaming_content)
+        return response
+    return async_view
+
+
+upload_couriers = in_pool(views.upload_couriers)
+update_couriers = in_pool(views.update_couriers)
+upload_orders = in_pool(views.upload_orders)
+assign_orders = in_pool(views.assign_orders)
+assign_orders_batch = in_pool(views.assign_orders_batch)
+complete_order = in_pool(views.complete_order)
+complete_orders_batch = in_pool(views.complete_orders_batch)
@@ -0,0 +1,101 @@
+"""
+Read-through cache of courier profiles.
+
+Profile of courier is stored under a key with current version of this courier. Everything that changes courier moves
+it to a new random version, so old entries are never read again and simply expire. Versions moved by one worker are
+seen by others only in a shared cache, without SHARED_CACHE profiles are built for every request.
+"""
+import hashlib
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+COUNTERS = ('hits', 'misses')
+
+
+def version_key(courier_id):
+    return 'courier:{0}:version'.format(courier_id)
+
+
+def profile_key(courier_id, version):
+    return 'courier:{0}:profile:{1}'.format(courier_id, version)
+
+
+def counter_key(name):
+    return 'courier-profile:{0}'.format(name)
+
+
+def current_version(courier_id):
+    version = cache.get(version_key(courier_id))
+    if version is None:
+        cache.add(version_key(courier_id), uuid.uuid4().hex, None)
+        version = cache.get(version_key(courier_id))
+    return version
+
+
+def invalidate(courier_id):
+    """
+    Drops cached profile of courier once the current transaction is committed, so nobody could cache the state
+    that is about to change
+    """
+    transaction.on_commit(lambda: cache.set(version_key(courier_id), uuid.uuid4().hex, None))
+
+
+def count(name):
+    if not cache.add(counter_key(name), 1, None):
+        try:
+            cache.incr(counter_key(name))
+        except ValueError:
+            cache.add(counter_key(name), 1, None)
+
+
+def stats():
+    """
+    Hits and misses of profile cache counted by all processes sharing the cache
+    """
+    return {name: cache.get(counter_key(name), 0) for name in COUNTERS}
+
+
+def cached_profile(request, courier_id, build):
+    """
+    Returns profile built by build(courier_id) from cache if possible and answers conditional requests with 304
+    """
+    if not settings.SHARED_CACHE:
+        response = build(courier_id)
+        if response.status_code != 200:
+            return response
+        # Without the cache there is no time of the last change, so only ETag is given
+        entry = {'content': response.content, 'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+                 'last_modified': None}
+        state = 'BYPASS'
+    else:
+        key = profile_key(courier_id, current_version(courier_id))
+        entry = cache.get(key)
+        if entry is None:
+            count('misses')
+            response = build(courier_id)
+            if response.status_code != 200:
+                return response
+            entry = {
+                'content': response.content,
+                'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+                'last_modified': int(time.time())
+            }
+            cache.set(key, entry, settings.COURIER_CACHE_TIMEOUT)
+            state = 'MISS'
+        else:
+            count('hits')
+            state = 'HIT'
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['content'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    response['X-Cache'] = state
+    return response
@@ -0,0 +1,51 @@
+"""
+Background dispatcher of orders.
+
+Uploads of orders and changes of couriers enqueue jobs for couriers who could get other orders now, run_dispatcher
+command takes the jobs and packs offers for those couriers in advance. Assignment claims the offer only while it's
+valid: the courier has the same free space, all the orders are still free and no job waits for the courier. A job is
+committed together with the upload or change that made it, so a waiting job means the backlog changed after the
+offer's candidates were read, maybe while the dispatcher was packing them. Otherwise assignment packs orders itself.
+"""
+from django.conf import settings
+from .models import Courier, Order, DispatchJob, Offer
+
+
+def enabled():
+    return settings.DISPATCHER
+
+
+def enqueue(courier_ids):
+    """
+    Drops offers of couriers and asks dispatcher to make new ones
+    """
+    if enabled() and len(courier_ids) != 0:
+        Offer.objects.filter(courier_id__in=courier_ids).delete()
+        DispatchJob.objects.bulk_create([DispatchJob(courier_id=courier_id) for courier_id in courier_ids],
+                                        ignore_conflicts=True)
+
+
+def enqueue_regions(regions):
+    """
+    Enqueues couriers working in any of regions
+    """
+    if enabled() and len(regions) != 0:
+        enqueue(list(Courier.objects.filter(regions__overlap=list(regions)).values_list('courier_id', flat=True)))
+
+
+def claim_offer(courier, space):
+    """
+    Orders of offer of locked courier or None if there is no valid offer. Orders are locked and the offer is used up,
+    an empty offer stays valid till something changes
+    """
+    offer = Offer.objects.filter(courier=courier).first()
+    if offer is None or DispatchJob.objects.filter(courier=courier).exists():
+        return None
+    orders = Order.objects.filter(order_id__in=offer.order_ids, done=False, assigned_to__isnull=True) \
+        .select_for_update(skip_locked=True).in_bulk()
+    if offer.space != space or len(orders) != len(offer.order_ids):
+        offer.delete()
+        return None
+    if len(orders) != 0:
+        offer.delete()
+    return [orders[order_id] for order_id in offer.order_ids]
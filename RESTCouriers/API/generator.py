@@ -0,0 +1,86 @@
+"""
+Deterministic synthetic couriers and orders for benchmarks.
+
+Every item is generated from the seed and its own id, so the same options always give the same data whatever number
+of items is asked for.
+"""
+import random
+from .models import Courier, Order, CAPACITIES
+from .serializers import OrderSerializer
+
+WEIGHTS = ('uniform', 'light', 'heavy')
+
+
+class DataGenerator:
+    def __init__(self, first_id, seed=0, regions=20, window_hours=3, shift_hours=8, weights='uniform'):
+        if weights not in WEIGHTS:
+            raise ValueError('Weight distribution should be one of {0}'.format(', '.join(WEIGHTS)))
+        self.first_id = first_id
+        self.seed = seed
+        self.regions = list(range(first_id, first_id + regions))
+        self.window_hours = window_hours
+        self.shift_hours = shift_hours
+        self.weights = weights
+
+    def random(self, kind, item_id):
+        return random.Random('{0}:{1}:{2}'.format(self.seed, kind, item_id))
+
+    def ids(self, count):
+        return range(self.first_id, self.first_id + count)
+
+    def bounds(self, count):
+        return self.first_id, self.first_id + count - 1
+
+    @staticmethod
+    def gap(start_hour, hours):
+        return '{0:02d}:00-{1:02d}:00'.format(start_hour, start_hour + hours)
+
+    def weight(self, rng):
+        if self.weights == 'light':
+            weight = rng.expovariate(1 / 2)
+        elif self.weights == 'heavy':
+            weight = 50 - rng.expovariate(1 / 10)
+        else:
+            weight = rng.uniform(0.01, 50)
+        return min(max(round(weight, 2), 0.01), 50)
+
+    def courier(self, courier_id):
+        rng = self.random('courier', courier_id)
+        shifts = [self.gap(rng.randrange(24 - self.shift_hours), self.shift_hours) for _ in range(rng.randint(1, 2))]
+        return {
+            'courier_id': courier_id,
+            'courier_type': rng.choice(sorted(CAPACITIES)),
+            'regions': sorted(rng.sample(self.regions, min(len(self.regions), rng.randint(1, 3)))),
+            'working_hours': sorted(set(shifts)),
+        }
+
+    def order(self, order_id):
+        rng = self.random('order', order_id)
+        return {
+            'order_id': order_id,
+            'weight': self.weight(rng),
+            'region': rng.choice(self.regions),
+            'delivery_hours': [self.gap(rng.randrange(24 - self.window_hours), self.window_hours)],
+        }
+
+    def couriers(self, count):
+        return [self.courier(courier_id) for courier_id in self.ids(count)]
+
+    def orders(self, count):
+        return [self.order(order_id) for order_id in self.ids(count)]
+
+    def taken(self, couriers, orders):
+        """
+        Tells if ids that couriers or orders of this size would get are already used
+        """
+        return Courier.objects.filter(courier_id__range=self.bounds(couriers)).exists() or \
+            Order.objects.filter(order_id__range=self.bounds(orders)).exists()
+
+    def create(self, couriers, orders):
+        Courier.objects.bulk_create((Courier(**courier) for courier in self.couriers(couriers)), 1000)
+        OrderSerializer.bulk_create([Order(**order) for order in self.orders(orders)], 1000)
+
+    def delete(self, couriers, orders):
+        # Windows and statistics go with their orders and couriers
+        Order.objects.filter(order_id__range=self.bounds(orders)).delete()
+        Courier.objects.filter(courier_id__range=self.bounds(couriers)).delete()
@@ -0,0 +1,136 @@
+"""
+Idempotency-Key support for POST requests.
+
+Response of the first completed request with a key is kept in cache for IDEMPOTENCY_TTL seconds and given back to
+repeated requests with the same key instead of doing the work again. Request that comes while the first one is still
+in progress waits for its response up to IDEMPOTENCY_WAIT seconds. The first request holds a lock with its own token
+and prolongs it while it runs, so a long upload doesn't let a retry in and never releases the lock of another
+request. Streamed and long responses are not kept, repeated
+requests only learn that the work is done. Keys work only with a cache shared by all processes of the server, retry
+that comes to another worker would not see the key otherwise, so they are ignored without SHARED_CACHE.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from . import streaming
+
+POLL_INTERVAL = 0.05
+
+
+def response_key(name):
+    return 'idempotency:{0}:response'.format(name)
+
+
+def lock_key(name):
+    return 'idempotency:{0}:lock'.format(name)
+
+
+def body_fingerprint(request):
+    """
+    Hash of body to tell another request with the same key, streamed and long bodies are not read to memory for it
+    """
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    if streaming.is_streamed(request) or limit is not None and int(request.META.get('CONTENT_LENGTH') or 0) > limit:
+        return None
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def replay(entry, fingerprint):
+    if entry['fingerprint'] is not None and fingerprint is not None and entry['fingerprint'] != fingerprint:
+        return JsonResponse({'request_error': 'Idempotency-Key is already used with another request'}, status=422)
+    if entry['content'] is None:
+        return JsonResponse({'request_error': 'Request with this Idempotency-Key is already done with status {0}, '
+                                              'its response is not kept'.format(entry['status'])},
+                            status=409)
+    response = HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def remember(name, fingerprint, response):
+    """
+    Keeps response unless it is a server error. Streamed responses and ones longer than IDEMPOTENCY_MAX_BYTES are
+    not read to memory, only the fact that the work is done is kept for them
+    """
+    if response.status_code < 500:
+        kept = not response.streaming and len(response.content) <= settings.IDEMPOTENCY_MAX_BYTES
+        cache.set(response_key(name), {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'content': response.content if kept else None,
+            'content_type': response['Content-Type'],
+        }, settings.IDEMPOTENCY_TTL)
+    return response
+
+
+class KeyLock:
+    """
+    Lock of a key held by one request. Its value is a token of the request, and it is prolonged by a thread every
+    third of IDEMPOTENCY_LOCK_TIMEOUT until the request releases it
+    """
+    def __init__(self, name):
+        self.key = lock_key(name)
+        self.token = uuid.uuid4().hex
+        self.released = threading.Event()
+        self.keeper = None
+
+    def acquire(self):
+        if not cache.add(self.key, self.token, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return False
+        self.keeper = threading.Thread(target=self.keep, daemon=True)
+        self.keeper.start()
+        return True
+
+    def owned(self):
+        return cache.get(self.key) == self.token
+
+    def keep(self):
+        while not self.released.wait(settings.IDEMPOTENCY_LOCK_TIMEOUT / 3):
+            if not self.owned() or not cache.touch(self.key, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                return
+
+    def release(self):
+        self.released.set()
+        self.keeper.join()
+        # The lock is prolonged until now, so it can't expire and go to another request between the two calls
+        if self.owned():
+            cache.delete(self.key)
+
+
+def idempotent(view):
+    """
+    Makes POST requests of view with Idempotency-Key header to be done once per key
+    """
+    @wraps(view)
+    def idempotent_view(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if request.method != 'POST' or not key or not settings.SHARED_CACHE:
+            return view(request, *args, **kwargs)
+        name = hashlib.sha256('{0}:{1}'.format(request.path, key).encode()).hexdigest()
+        fingerprint = body_fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        lock = KeyLock(name)
+        while True:
+            entry = cache.get(response_key(name))
+            if entry is not None:
+                return replay(entry, fingerprint)
+            if lock.acquire():
+                break
+            if time.monotonic() > deadline:
+                return JsonResponse({'request_error': 'Request with this Idempotency-Key is still in progress'},
+                                    status=409)
+            time.sleep(POLL_INTERVAL)
+        try:
+            # The previous holder of the lock could finish between the two reads
+            entry = cache.get(response_key(name))
+            if entry is not None:
+                return replay(entry, fingerprint)
+            return remember(name, fingerprint, view(request, *args, **kwargs))
+        finally:
+            lock.release()
+    return idempotent_view
@@ -0,0 +1,147 @@
+"""
+Per-request instrumentation: wall time, database time, number of queries and duplicated ones and time spent on
+packing orders. Numbers go to Server-Timing header and to a structured log line of every request, full list of queries
+is logged for a sample of slow requests. Requests are sampled when they start and only sampled ones keep text of their
+queries, the rest keep counters, so long uploads don't hold SQL of every chunk.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from . import metrics
+
+logger = logging.getLogger(__name__)
+current = ContextVar('request_metrics', default=None)
+# Sampled requests keep at most this number of queries for the log
+QUERY_LIST_LIMIT = 200
+
+
+class RequestMetrics:
+    def __init__(self, sampled=False):
+        self.sampled = sampled
+        self.count = 0
+        self.db_seconds = 0
+        # Number of executions of every query by hash of its SQL and parameters
+        self.executions = {}
+        self.queries = []
+        self.solve_seconds = 0
+        self.solves = 0
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.executions)
+
+    def add_query(self, sql, params, seconds):
+        self.count += 1
+        self.db_seconds += seconds
+        params = repr(params)
+        key = hash((sql, params))
+        self.executions[key] = self.executions.get(key, 0) + 1
+        if self.sampled and len(self.queries) < QUERY_LIST_LIMIT:
+            self.queries.append((sql, params, seconds))
+
+
+def start_request():
+    return RequestMetrics(random.random() < settings.INSTRUMENTATION_SAMPLE_RATE)
+
+
+def measure_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection, it does nothing outside of instrumented requests
+    """
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, params, time.perf_counter() - started)
+
+
+def install_wrapper(sender, connection, **kwargs):
+    if measure_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(measure_query)
+
+
+connection_created.connect(install_wrapper)
+
+
+def record_solve(seconds):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.solve_seconds += seconds
+        metrics.solves += 1
+
+
+class InstrumentationMiddleware:
+    """
+    Works in both modes, under ASGI a sync only middleware would serve all requests one by one in the single thread
+    Django keeps for sync code
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Django tells coroutine middleware by this marker
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request_metrics = start_request()
+        token = current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.report(request, response, request_metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        request_metrics = start_request()
+        token = current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.report(request, response, request_metrics, time.perf_counter() - started)
+
+    @staticmethod
+    def report(request, response, request_metrics, total):
+        """
+        Adds Server-Timing header, records the request in metrics and logs it
+        """
+        route = request.resolver_match.route if request.resolver_match is not None else None
+        metrics.observe_request(route or 'unmatched', request.method, response.status_code, total)
+        response['Server-Timing'] = 'app;dur={0:.1f}, db;dur={1:.1f};desc="{2} queries, {3} duplicates", ' \
+                                    'knapsack;dur={4:.1f}'.format(total * 1000, request_metrics.db_seconds * 1000,
+                                                                  request_metrics.count,
+                                                                  request_metrics.duplicates,
+                                                                  request_metrics.solve_seconds * 1000)
+        line = {
+            'view': route,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'wall_ms': round(total * 1000, 2),
+            'db_ms': round(request_metrics.db_seconds * 1000, 2),
+            'queries': request_metrics.count,
+            'duplicate_queries': request_metrics.duplicates,
+            'knapsack_ms': round(request_metrics.solve_seconds * 1000, 2),
+            'knapsack_solves': request_metrics.solves,
+        }
+        if request_metrics.sampled and total * 1000 >= settings.INSTRUMENTATION_SLOW_MS:
+            line['query_list'] = [{'sql': sql, 'params': params, 'ms': round(seconds * 1000, 2)}
+                                  for sql, params, seconds in request_metrics.queries]
+            logger.warning(json.dumps(line))
+        else:
+            logger.info(json.dumps(line))
+        return response
@@ -0,0 +1,75 @@
+"""
+Working and delivery hours as closed intervals of minutes since midnight.
+
+"HH:MM-HH:MM" gaps are parsed once and remembered, gap passing midnight becomes two intervals. List of gaps is turned
+to sorted intervals with overlapping and adjacent ones merged, so two lists are intersected in one pass over both.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+MINUTES_IN_DAY = 24 * 60
+
+Interval = namedtuple('Interval', ['start', 'finish'])
+
+
+def minute(moment):
+    return int(moment[:2]) * 60 + int(moment[3:])
+
+
+@lru_cache(maxsize=4096)
+def parse_gap(gap):
+    """
+    Intervals of "HH:MM-HH:MM" gap
+    """
+    start, finish = [minute(moment) for moment in gap.split('-')]
+    if start <= finish:
+        return (Interval(start, finish),)
+    return Interval(start, MINUTES_IN_DAY - 1), Interval(0, finish)
+
+
+def from_range(minutes):
+    """
+    Interval of range of minutes read from database, such ranges are half open
+    """
+    return Interval(minutes.lower, minutes.upper if minutes.upper_inc else minutes.upper - 1)
+
+
+def normalize(intervals):
+    """
+    Sorted intervals with overlapping and adjacent ones merged
+    """
+    merged = []
+    for start, finish in sorted(intervals):
+        if merged and start <= merged[-1].finish + 1:
+            if finish > merged[-1].finish:
+                merged[-1] = Interval(merged[-1].start, finish)
+        else:
+            merged.append(Interval(start, finish))
+    return tuple(merged)
+
+
+@lru_cache(maxsize=4096)
+def parse_hours(gaps):
+    return normalize(interval for gap in gaps for interval in parse_gap(gap))
+
+
+def hours(gaps):
+    """
+    Normalized intervals of list of gaps
+    """
+    return parse_hours(tuple(gaps))
+
+
+def intersects(first, second):
+    """
+    Tells if two normalized lists of intervals share a minute
+    """
+    i = j = 0
+    while i < len(first) and j < len(second):
+        if first[i].start <= second[j].finish and second[j].start <= first[i].finish:
+            return True
+        if first[i].finish < second[j].finish:
+            i += 1
+        else:
+            j += 1
+    return False
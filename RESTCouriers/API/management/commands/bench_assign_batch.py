@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from API.generator import DataGenerator
+from API.views import validated_assign_couriers, validated_assign_batch
+
+
+class Command(BaseCommand):
+    help = 'Compares one batch assignment for many couriers with sequential single assignments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couriers', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--regions', type=int, default=20)
+        parser.add_argument('--first-id', type=int, default=5000000,
+                            help='Couriers, orders and regions of the run get ids starting from this one')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(options['first_id'], regions=options['regions'])
+        if generator.taken(options['couriers'], options['orders']):
+            raise CommandError('Ids starting from {0} are already taken, choose other --first-id'.format(
+                options['first_id']))
+        courier_ids = list(generator.ids(options['couriers']))
+        try:
+            generator.create(options['couriers'], options['orders'])
+            with transaction.atomic():
+                started = time.perf_counter()
+                single = [[order['id'] for order in validated_assign_couriers({'courier_id': courier_id})[0]['orders']]
+                          for courier_id in courier_ids]
+                single_time = time.perf_counter() - started
+                transaction.set_rollback(True)
+            with transaction.atomic():
+                started = time.perf_counter()
+                batch, _ = validated_assign_batch(courier_ids)
+                batch_time = time.perf_counter() - started
+                transaction.set_rollback(True)
+            self.stdout.write('single calls: {0:.2f} s, {1:.1f} couriers/s'.format(
+                single_time, len(courier_ids) / single_time))
+            self.stdout.write('batch call: {0:.2f} s, {1:.1f} couriers/s'.format(
+                batch_time, len(courier_ids) / batch_time))
+            self.stdout.write('{0} orders assigned by single calls, {1} by batch'.format(
+                sum(map(len, single)), sum(map(len, batch))))
+            differing = [courier_id for courier_id, ids, batch_ids in zip(courier_ids, single, batch)
+                         if ids != batch_ids]
+            if differing:
+                raise CommandError('Batch assignment differs from single calls for couriers {0}'.format(
+                    differing[:20]))
+        finally:
+            generator.delete(options['couriers'], options['orders'])
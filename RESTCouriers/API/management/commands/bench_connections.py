@@ -0,0 +1,61 @@
+import statistics
+import time
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from RESTCouriers.postgresql import base
+from API.models import Courier
+
+MODES = {
+    'new connection': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 0},
+    'persistent': {'CONN_MAX_AGE': 60, 'POOL_SIZE': 0},
+    'pooled': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 4},
+}
+
+
+class Command(BaseCommand):
+    help = 'Measures latency of GET /couriers/<id> through the WSGI handler with new, persistent and pooled ' \
+           'database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--courier-id', type=int, default=6000000,
+                            help='Id of the courier created for the run')
+
+    def handle(self, *args, **options):
+        courier_id = options['courier_id']
+        if Courier.objects.filter(courier_id=courier_id).exists():
+            raise CommandError('Courier {0} already exists, choose other --courier-id'.format(courier_id))
+        Courier.objects.create(courier_id=courier_id, courier_type='bike', regions=[1, 2],
+                               working_hours=['09:00-18:00'])
+        original = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'POOL_SIZE')}
+        handler = WSGIHandler()
+        environ = RequestFactory().get('/couriers/{0}'.format(courier_id), HTTP_HOST='127.0.0.1').environ
+        try:
+            for mode, database_settings in MODES.items():
+                connection.close()
+                connection.settings_dict.update(database_settings)
+                latencies = []
+                for _ in range(options['requests']):
+                    # Profile would be served from cache without touching the database
+                    cache.clear()
+                    started = time.perf_counter()
+                    response = handler(environ, lambda status, headers: None)
+                    response.close()
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise CommandError('GET /couriers/{0} answered {1}'.format(courier_id,
+                                                                                   response.status_code))
+                latencies.sort()
+                self.stdout.write('{0}: mean {1:.2f} ms, p50 {2:.2f} ms, p99 {3:.2f} ms'.format(
+                    mode, statistics.mean(latencies) * 1000, latencies[len(latencies) // 2] * 1000,
+                    latencies[len(latencies) * 99 // 100] * 1000))
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+            for pool in base.pools.values():
+                pool.close_all()
+            base.pools.clear()
+            Courier.objects.filter(courier_id=courier_id).delete()
@@ -0,0 +1,65 @@
+import datetime
+import json
+import random
+import time
+from django.core.management.base import BaseCommand
+from API import intervals
+
+
+def strptime_intersect(delivery_gap, working_hours):
+    """
+    Check of intersection as it was done before with parsing of strings on every comparison
+    """
+    for working_gap in working_hours:
+        finish_is_later = datetime.datetime.strptime(working_gap.split('-')[1], '%H:%M') >= \
+            datetime.datetime.strptime(delivery_gap.split('-')[0], '%H:%M')
+        start_is_earlier = datetime.datetime.strptime(working_gap.split('-')[0], '%H:%M') <= \
+            datetime.datetime.strptime(delivery_gap.split('-')[1], '%H:%M')
+        if start_is_earlier and finish_is_later:
+            return True
+    return False
+
+
+def gap(rng):
+    start = rng.randrange(23 * 60)
+    finish = rng.randrange(start, 24 * 60)
+    return '{0:02d}:{1:02d}-{2:02d}:{3:02d}'.format(start // 60, start % 60, finish // 60, finish % 60)
+
+
+class Command(BaseCommand):
+    help = 'Measures throughput of intersection of delivery hours with working hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100000)
+        parser.add_argument('--working-gaps', type=int, default=3)
+        parser.add_argument('--distinct', type=int, default=1000,
+                            help='Number of different working hours, real couriers share a few schedules')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        schedules = [[gap(rng) for _ in range(options['working_gaps'])] for _ in range(options['distinct'])]
+        pairs = [(gap(rng), rng.choice(schedules)) for _ in range(options['pairs'])]
+        intervals.parse_gap.cache_clear()
+        intervals.parse_hours.cache_clear()
+        started = time.perf_counter()
+        expected = [strptime_intersect(delivery_gap, working_hours) for delivery_gap, working_hours in pairs]
+        strptime_time = time.perf_counter() - started
+        started = time.perf_counter()
+        found = [intervals.intersects(intervals.hours([delivery_gap]), intervals.hours(working_hours))
+                 for delivery_gap, working_hours in pairs]
+        parsed_time = time.perf_counter() - started
+        # Parsed hours are kept by assignment, so the sweep alone is what repeats for every order
+        parsed = [(intervals.hours([delivery_gap]), intervals.hours(working_hours))
+                  for delivery_gap, working_hours in pairs]
+        started = time.perf_counter()
+        for delivery, working in parsed:
+            intervals.intersects(delivery, working)
+        sweep_time = time.perf_counter() - started
+        self.stdout.write(json.dumps({
+            'pairs': len(pairs),
+            'strptime_per_second': len(pairs) / strptime_time,
+            'cached_parse_per_second': len(pairs) / parsed_time,
+            'sweep_per_second': len(pairs) / sweep_time,
+            'same_answers': expected == found,
+        }, indent=2))
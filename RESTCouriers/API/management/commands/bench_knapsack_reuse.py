@@ -0,0 +1,72 @@
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API import allocation
+from API.generator import DataGenerator, WEIGHTS
+from API.models import CAPACITIES, hundredths
+
+
+class Command(BaseCommand):
+    help = 'Measures amortized packing time of a stream of assignments from one slowly changing backlog with rows ' \
+           'computed from scratch and reused from the previous call'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backlog', type=int, default=2000, help='Orders waiting at the start')
+        parser.add_argument('--calls', type=int, default=500)
+        parser.add_argument('--arrivals', type=int, default=2, help='Orders uploaded between two calls')
+        parser.add_argument('--budget', type=int, default=64 * 1024 * 1024, help='Bytes of cached rows')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--weights', choices=WEIGHTS, default='uniform')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(1, options['seed'], regions=1, weights=options['weights'])
+        settings.KNAPSACK_CACHE_BYTES = options['budget']
+        full = self.stream(generator, options, lambda space, keys, weights: allocation.bitset_knapsack(
+            space, weights))
+        allocation.row_cache = None
+        reused = self.stream(generator, options, lambda space, keys, weights: allocation.incremental_knapsack(
+            'backlog', keys, space, weights))
+        self.stdout.write(json.dumps({
+            'options': {name: options[name] for name in ('backlog', 'calls', 'arrivals', 'budget', 'seed', 'weights')},
+            'full': full['timing'],
+            'reused': reused['timing'],
+            'reused_rows': allocation.get_row_cache().reused_rows / max(allocation.get_row_cache().rows, 1),
+            'cached_bytes': allocation.get_row_cache().size,
+            'same_answers': full['answers'] == reused['answers'],
+        }, indent=2))
+
+    @staticmethod
+    def stream(generator, options, pack):
+        """
+        Couriers of every type take turns, so rows are shared by different spaces, packed orders leave the backlog and
+        new ones arrive after every call
+        """
+        backlog = {order['order_id']: hundredths(order['weight']) for order in generator.orders(options['backlog'])}
+        next_id = options['backlog'] + 1
+        capacities = [capacity * 100 for _, capacity in sorted(CAPACITIES.items())]
+        answers = []
+        latencies = []
+        for call in range(options['calls']):
+            space = capacities[call % len(capacities)]
+            # The order of candidate_orders, heaviest first and ties by id
+            keys = tuple((order_id, weight) for order_id, weight in
+                         sorted(backlog.items(), key=lambda item: (-item[1], item[0])) if weight <= space)
+            weights = [weight for _, weight in keys]
+            started = time.perf_counter()
+            chosen = pack(space, keys, weights)
+            latencies.append(time.perf_counter() - started)
+            answers.append([keys[index][0] for index in chosen])
+            for index in chosen:
+                del backlog[keys[index][0]]
+            for _ in range(options['arrivals']):
+                backlog[next_id] = hundredths(generator.order(next_id)['weight'])
+                next_id += 1
+        return {
+            'answers': answers,
+            'timing': {
+                'seconds': sum(latencies),
+                'mean_ms': sum(latencies) / len(latencies) * 1000,
+                'calls_per_second': len(latencies) / sum(latencies),
+            },
+        }
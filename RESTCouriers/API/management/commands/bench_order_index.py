@@ -0,0 +1,52 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from API.generator import DataGenerator
+from API.models import Courier, CAPACITIES
+from API.order_index import OrderIndex
+from API.views import candidate_orders
+
+
+class Command(BaseCommand):
+    help = 'Compares search of candidate orders in the database with the in-process index on a generated backlog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--couriers', type=int, default=200)
+        parser.add_argument('--regions', type=int, default=20)
+        parser.add_argument('--first-id', type=int, default=8000000,
+                            help='Couriers, orders and regions of the run get ids starting from this one')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(options['first_id'], regions=options['regions'])
+        if generator.taken(options['couriers'], options['orders']):
+            raise CommandError('Ids starting from {0} are already taken, choose other --first-id'.format(
+                options['first_id']))
+        try:
+            generator.create(options['couriers'], options['orders'])
+            couriers = list(Courier.objects.filter(courier_id__range=generator.bounds(options['couriers'])))
+            started = time.perf_counter()
+            index = OrderIndex.build()
+            build_time = time.perf_counter() - started
+            with transaction.atomic():
+                started = time.perf_counter()
+                expected = [list(candidate_orders(courier, CAPACITIES[courier.courier_type] * 100).values_list(
+                    'order_id', flat=True)) for courier in couriers]
+                database_time = time.perf_counter() - started
+            started = time.perf_counter()
+            found = [index.candidates(courier.regions, courier.working_hours, CAPACITIES[courier.courier_type] * 100)
+                     for courier in couriers]
+            index_time = time.perf_counter() - started
+            result = {
+                'orders': options['orders'],
+                'couriers': len(couriers),
+                'build_seconds': build_time,
+                'database_ms_per_courier': database_time / len(couriers) * 1000,
+                'index_ms_per_courier': index_time / len(couriers) * 1000,
+                'speedup': database_time / index_time,
+                'same_candidates': [set(ids) for ids in expected] == [set(ids) for ids in found],
+            }
+            self.stdout.write(json.dumps(result, indent=2))
+        finally:
+            generator.delete(options['couriers'], options['orders'])
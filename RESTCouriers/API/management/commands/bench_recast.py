@@ -0,0 +1,53 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from API.models import Courier, Order, AssignmentBatch, DeliveryWindow
+from API.serializers import OrderSerializer
+from API.views import update_couriers
+
+
+class Command(BaseCommand):
+    help = 'Measures PATCH of a car courier holding many orders to a foot one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--first-id', type=int, default=2000000,
+                            help='Courier, orders and region of the run get ids starting from this one')
+
+    def handle(self, *args, **options):
+        courier_id = region = options['first_id']
+        order_ids = list(range(options['first_id'], options['first_id'] + options['orders']))
+        if Courier.objects.filter(courier_id=courier_id).exists() or \
+                Order.objects.filter(order_id__in=order_ids).exists():
+            raise CommandError('Ids starting from {0} are already taken, choose other --first-id'.format(courier_id))
+        courier = Courier.objects.create(courier_id=courier_id, courier_type='car', regions=[region],
+                                         working_hours=['00:00-23:59'])
+        OrderSerializer.bulk_create(
+            [Order(order_id=order_id, weight=round(0.01 + order_id % 10 / 100, 2), region=region,
+                   delivery_hours=['10:00-18:00']) for order_id in order_ids], 1000)
+        factory = RequestFactory()
+        try:
+            for _ in range(options['repeat']):
+                Courier.objects.filter(courier_id=courier_id).update(courier_type='car')
+                AssignmentBatch.objects.filter(courier=courier).delete()
+                batch = AssignmentBatch.add(courier, None, Order.objects.filter(order_id__in=order_ids),
+                                            timezone.now())
+                Order.objects.filter(order_id__in=order_ids).update(assigned_to=courier, batch=batch)
+                request = factory.patch('/couriers/{0}'.format(courier_id), json.dumps({'courier_type': 'foot'}),
+                                        content_type='application/json')
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    update_couriers(request, courier_id)
+                    elapsed = time.perf_counter() - started
+                kept = Order.objects.filter(assigned_to=courier).count()
+                self.stdout.write('{0} orders: {1:.1f} ms, {2} queries, {3} orders kept'.format(
+                    len(order_ids), elapsed * 1000, len(queries), kept))
+        finally:
+            DeliveryWindow.objects.filter(order_id__in=order_ids).delete()
+            Order.objects.filter(order_id__in=order_ids).delete()
+            courier.delete()
@@ -0,0 +1,93 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from API.instrumentation import InstrumentationMiddleware
+from API.views import upload_orders
+
+MODES = {
+    'buffered': ('application/json', ''),
+    'stream': ('application/json', 'stream=1'),
+    'ndjson': ('application/x-ndjson', ''),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares peak RSS of POST /orders for buffered JSON, streamed JSON and NDJSON bodies. ' \
+           'Streamed bodies still keep ids of created orders for the response, so their peak RSS grows by about ' \
+           '8 bytes per order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+        parser.add_argument('--first-id', type=int, default=4000000,
+                            help='Orders of the run get ids starting from this one, they are rolled back')
+        parser.add_argument('--single', type=int, help='Run one upload of this size in this process')
+
+    def handle(self, *args, **options):
+        if options['single']:
+            self.stdout.write(json.dumps(self.upload(options['single'], options['modes'][0], options['first_id'])))
+            return
+        results = []
+        for size in options['sizes']:
+            for mode in options['modes']:
+                # Every upload runs in its own process because peak RSS never goes down
+                output = subprocess.run(
+                    [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_upload_memory',
+                     '--single', str(size), '--modes', mode, '--first-id', str(options['first_id'])],
+                    check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+                self.stderr.write('{orders} orders, {mode}: {peak_rss_kb} kB peak RSS, {seconds:.1f} s'.format(
+                    **results[-1]))
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def upload(size, mode, first_id):
+        settings.DATA_UPLOAD_MAX_MEMORY_SIZE = None
+        content_type, query = MODES[mode]
+        with tempfile.TemporaryFile() as body:
+            Command.write_body(body, size, first_id, mode == 'ndjson')
+            length = body.tell()
+            body.seek(0)
+            environ = RequestFactory().post('/orders', content_type=content_type).environ
+            environ.update({'wsgi.input': body, 'CONTENT_LENGTH': str(length), 'QUERY_STRING': query})
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            with transaction.atomic():
+                # The view goes through instrumentation like in the middleware chain, its per-query bookkeeping counts
+                response = InstrumentationMiddleware(upload_orders)(WSGIRequest(environ))
+                for _ in response:
+                    pass
+                transaction.set_rollback(True)
+            elapsed = time.perf_counter() - started
+        return {
+            'mode': mode,
+            'orders': size,
+            'body_bytes': length,
+            'status': response.status_code,
+            'seconds': elapsed,
+            'baseline_rss_kb': baseline,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    @staticmethod
+    def write_body(body, size, first_id, ndjson):
+        if not ndjson:
+            body.write(b'{"data": [')
+        for order_id in range(first_id, first_id + size):
+            order = json.dumps({'order_id': order_id, 'weight': round(0.01 + order_id % 500 / 10, 2),
+                                'region': order_id % 50 + 1, 'delivery_hours': ['10:00-12:00', '16:00-20:00']})
+            if ndjson:
+                body.write(order.encode() + b'\n')
+            else:
+                body.write((order if order_id == first_id else ', ' + order).encode())
+        if not ndjson:
+            body.write(b']}')
@@ -0,0 +1,143 @@
+import json
+import subprocess
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from API import allocation, views
+from API.generator import DataGenerator, WEIGHTS
+from API.models import CAPACITIES, hundredths
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    if len(latencies) == 0:
+        return {'calls': 0}
+    return {
+        'calls': len(latencies),
+        'seconds': sum(latencies),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000,
+    }
+
+
+def timed(call, *args):
+    started = time.perf_counter()
+    result = call(*args)
+    return result, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Measures how endpoints scale with the number of rows on generated data and prints results as JSON, ' \
+           'results of runs on different commits with the same options can be compared'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Numbers of couriers and orders in the database')
+        parser.add_argument('--calls', type=int, default=200,
+                            help='Calls of assign, complete and profile endpoints measured at every size')
+        parser.add_argument('--backlogs', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                            help='Numbers of candidate orders in measured packing problems')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--regions', type=int, default=20)
+        parser.add_argument('--window-hours', type=int, default=3)
+        parser.add_argument('--shift-hours', type=int, default=8)
+        parser.add_argument('--weights', choices=WEIGHTS, default='uniform')
+        parser.add_argument('--first-id', type=int, default=7000000,
+                            help='Couriers, orders and regions of the run get ids starting from this one')
+        parser.add_argument('--output', help='File for results instead of standard output')
+
+    def handle(self, *args, **options):
+        settings.DATA_UPLOAD_MAX_MEMORY_SIZE = None
+        generator = DataGenerator(options['first_id'], options['seed'], options['regions'], options['window_hours'],
+                                  options['shift_hours'], options['weights'])
+        results = {
+            'commit': self.commit(),
+            'options': {name: options[name] for name in ('sizes', 'calls', 'backlogs', 'seed', 'regions',
+                                                         'window_hours', 'shift_hours', 'weights')},
+            'endpoints': [],
+            'knapsack': self.knapsack(generator, options['backlogs']),
+        }
+        for size in options['sizes']:
+            if generator.taken(size, size):
+                raise CommandError('Ids starting from {0} are already taken, choose other --first-id'.format(
+                    options['first_id']))
+            try:
+                for result in self.endpoints(generator, size, options['calls']):
+                    results['endpoints'].append(dict(result, rows=size))
+                    self.stderr.write('{endpoint} at {rows} rows: {seconds:.2f} s'.format(**results['endpoints'][-1]))
+            finally:
+                generator.delete(size, size)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+        except OSError:
+            return None
+
+    @staticmethod
+    def post(view, path, body):
+        request = RequestFactory().post(path, data=json.dumps(body), content_type='application/json')
+        response, elapsed = timed(view, request)
+        if response.status_code >= 300:
+            raise CommandError('{0} answered {1}: {2}'.format(path, response.status_code, response.content[:500]))
+        return json.loads(response.content), elapsed
+
+    def endpoints(self, generator, size, calls):
+        _, elapsed = self.post(views.upload_couriers, '/couriers', {'data': generator.couriers(size)})
+        yield {'endpoint': 'upload_couriers', 'seconds': elapsed, 'rows_per_second': size / elapsed}
+        _, elapsed = self.post(views.upload_orders, '/orders', {'data': generator.orders(size)})
+        yield {'endpoint': 'upload_orders', 'seconds': elapsed, 'rows_per_second': size / elapsed}
+
+        assigned = []
+        latencies = []
+        for courier_id in generator.ids(min(calls, size)):
+            answer, elapsed = self.post(views.assign_orders, '/orders/assign', {'courier_id': courier_id})
+            assigned.extend((courier_id, order['id']) for order in answer['orders'])
+            latencies.append(elapsed)
+        yield dict(summary(latencies), endpoint='assign_orders', orders_assigned=len(assigned))
+
+        latencies = []
+        for courier_id, order_id in assigned[:calls]:
+            _, elapsed = self.post(views.complete_order, '/orders/complete', {
+                'courier_id': courier_id, 'order_id': order_id, 'complete_time': timezone.now().isoformat()})
+            latencies.append(elapsed)
+        yield dict(summary(latencies), endpoint='complete_order')
+
+        # Profile is built every time, cache of the endpoint is not involved
+        latencies = [timed(views.see_courier, courier_id)[1] for courier_id in generator.ids(min(calls, size))]
+        yield dict(summary(latencies), endpoint='see_courier')
+
+    @staticmethod
+    def knapsack(generator, backlogs):
+        """
+        Packing time of the configured strategies for every capacity and number of candidate orders
+        """
+        results = []
+        orders = generator.orders(max(backlogs))
+        for courier_type, capacity in sorted(CAPACITIES.items(), key=lambda item: item[1]):
+            space = capacity * 100
+            for backlog in backlogs:
+                weights = sorted((hundredths(order['weight']) for order in orders[:backlog]), reverse=True)
+                weights = [weight for weight in weights if weight <= space]
+                chosen, elapsed = timed(allocation.solve, courier_type, space, weights)
+                results.append({
+                    'courier_type': courier_type,
+                    'strategy': settings.ALLOCATION_STRATEGIES.get(courier_type, 'bitset'),
+                    'capacity': space,
+                    'backlog': backlog,
+                    'candidates': len(weights),
+                    'packed': sum(weights[index] for index in chosen),
+                    'seconds': elapsed,
+                })
+        return results
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from API.models import Courier, AssignmentBatch
+from API.order_index import OrderIndex
+from API.views import candidate_orders
+
+
+class Command(BaseCommand):
+    help = 'Builds the index of orders waiting for assignment and checks that it proposes the same candidates as ' \
+           'the database search for every courier'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couriers', type=int, help='Check only this number of couriers')
+
+    def handle(self, *args, **options):
+        couriers = Courier.objects.order_by('courier_id')
+        if options['couriers'] is not None:
+            couriers = couriers[:options['couriers']]
+        couriers = list(couriers)
+        batches = AssignmentBatch.open_batches([courier.courier_id for courier in couriers])
+        index = OrderIndex.build()
+        mismatches = []
+        # Candidates are searched with lock, so the whole check reads one snapshot
+        with transaction.atomic():
+            for courier in couriers:
+                space = AssignmentBatch.space(courier, batches.get(courier.courier_id))
+                expected = list(candidate_orders(courier, space).values_list('order_id', 'weight'))
+                found = index.candidates(courier.regions, courier.working_hours, space)
+                if set(found) != set(order_id for order_id, _ in expected) or \
+                        [index.orders[order_id][1] for order_id in found] != [weight for _, weight in expected]:
+                    mismatches.append(courier.courier_id)
+        if mismatches:
+            raise CommandError('Index differs from database for couriers {0}'.format(mismatches[:20]))
+        self.stdout.write(self.style.SUCCESS('Index of {0} orders matches database for {1} couriers'.format(
+            len(index.orders), len(couriers))))
@@ -0,0 +1,78 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Sends requests to running servers with fixed concurrency and reports requests per second and latency, ' \
+           'e.g. --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, help='NAME=URL of a running server')
+        parser.add_argument('--path', default='/couriers/1')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--body', default=None, help='JSON body sent with every request')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        results = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError('Target should look like NAME=URL')
+            results.append(dict(self.load(url, options), target=name))
+            self.stderr.write('{target}: {rps:.1f} requests/s, p50 {p50_ms:.1f} ms, p99 {p99_ms:.1f} ms, '
+                              '{errors} errors'.format(**results[-1]))
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def load(url, options):
+        address = urlsplit(url)
+        latencies = []
+        errors = []
+        left = [options['requests']]
+        lock = threading.Lock()
+        body = options['body'].encode() if options['body'] is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+        def worker():
+            connection = http.client.HTTPConnection(address.hostname, address.port or 80)
+            while True:
+                with lock:
+                    if left[0] == 0:
+                        break
+                    left[0] -= 1
+                started = time.perf_counter()
+                try:
+                    connection.request(options['method'], options['path'], body=body, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 500:
+                        errors.append(response.status)
+                except (OSError, http.client.HTTPException) as error:
+                    errors.append(error)
+                    connection.close()
+                    connection = http.client.HTTPConnection(address.hostname, address.port or 80)
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'seconds': elapsed,
+            'rps': len(latencies) / elapsed,
+            'p50_ms': latencies[len(latencies) // 2] * 1000,
+            'p99_ms': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000,
+        }
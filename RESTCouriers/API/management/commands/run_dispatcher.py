@@ -0,0 +1,53 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+from API.models import Courier, AssignmentBatch, DispatchJob, Offer, CAPACITIES
+from API.views import candidates, packing
+
+
+class Command(BaseCommand):
+    help = 'Takes jobs enqueued by uploads of orders and changes of couriers and packs offers for those couriers in ' \
+           'advance, several dispatchers can run at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when there are no jobs left')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep when there are no jobs')
+        parser.add_argument('--batch', type=int, default=100, help='Jobs taken in one transaction')
+
+    def handle(self, *args, **options):
+        if not settings.DISPATCHER:
+            raise CommandError('Dispatcher is turned off, set DISPATCHER=1 for the server and this command')
+        while True:
+            close_old_connections()
+            done = self.process(options['batch'])
+            if done != 0:
+                self.stderr.write('Offers computed for {0} couriers'.format(done))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['interval'])
+
+    @staticmethod
+    def process(batch_size):
+        """
+        Takes jobs nobody else is working on and makes offers for their couriers, returns number of jobs done
+        """
+        with transaction.atomic():
+            courier_ids = list(DispatchJob.objects.select_for_update(skip_locked=True).order_by('created')
+                               .values_list('courier_id', flat=True)[:batch_size])
+            DispatchJob.objects.filter(courier_id__in=courier_ids).delete()
+        for courier_id in courier_ids:
+            with transaction.atomic():
+                # Courier is locked like in assignment so its space can't change while the offer is packed, courier
+                # locked by someone else is being assigned or changed and gets a new job after that
+                courier = Courier.objects.select_for_update(skip_locked=True).filter(courier_id=courier_id).first()
+                if courier is None or courier.courier_type not in CAPACITIES:
+                    continue
+                batch = AssignmentBatch.open_batches([courier_id]).get(courier_id)
+                space = AssignmentBatch.space(courier, batch)
+                # Orders are not locked, assignments in the region go on and claiming the offer checks them again
+                orders = packing(courier, space, candidates(courier, space))
+                Offer.objects.update_or_create(courier=courier, defaults={
+                    'order_ids': [order.order_id for order in orders], 'space': space})
+        return len(courier_ids)
@@ -0,0 +1,80 @@
+import threading
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from API.models import Courier, Order, AssignmentBatch, DeliveryWindow
+from API.serializers import OrderSerializer
+from API.views import validated_assign_couriers
+
+
+class Command(BaseCommand):
+    help = 'Runs concurrent assignments for couriers of one region and checks that no order is given twice ' \
+           'and every courier gets orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couriers', type=int, default=16)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--first-id', type=int, default=1000000,
+                            help='Couriers, orders and region of the run get ids starting from this one')
+
+    def handle(self, *args, **options):
+        first_id = options['first_id']
+        region = first_id
+        courier_ids = list(range(first_id, first_id + options['couriers']))
+        order_ids = list(range(first_id, first_id + options['orders']))
+        if Courier.objects.filter(courier_id__in=courier_ids).exists() or \
+                Order.objects.filter(order_id__in=order_ids).exists():
+            raise CommandError('Ids starting from {0} are already taken, choose other --first-id'.format(first_id))
+        types = ['foot', 'bike', 'car']
+        Courier.objects.bulk_create(
+            Courier(courier_id=courier_id, courier_type=types[courier_id % 3], regions=[region],
+                    working_hours=['00:00-23:59']) for courier_id in courier_ids)
+        OrderSerializer.bulk_create(
+            [Order(order_id=order_id, weight=round(0.01 + order_id % 997 / 100, 2), region=region,
+                   delivery_hours=['10:00-18:00']) for order_id in order_ids], 1000)
+        try:
+            total = 0
+            for _ in range(options['rounds']):
+                given = []
+                served = set()
+                errors = []
+                barrier = threading.Barrier(len(courier_ids))
+                threads = [threading.Thread(target=self.assign, args=(courier_id, barrier, given, served, errors))
+                           for courier_id in courier_ids]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                if errors:
+                    raise CommandError('Assignment failed: {0}'.format(errors[0]))
+                twice = [order_id for order_id, times in Counter(given).items() if times > 1]
+                if twice:
+                    raise CommandError('Orders assigned twice: {0}'.format(twice[:20]))
+                # Backlog is much heavier than all bags together, so every courier should get something
+                empty = [courier_id for courier_id in courier_ids if courier_id not in served]
+                if empty:
+                    raise CommandError('Couriers got no orders while others were assigned: {0}'.format(empty))
+                total += len(given)
+                AssignmentBatch.objects.filter(courier_id__in=courier_ids).delete()
+                Order.objects.filter(order_id__in=order_ids).update(assigned_to=None, assign_time=None, batch=None)
+            self.stdout.write(self.style.SUCCESS(
+                '{0} orders assigned in {1} rounds, no order assigned twice and no courier left empty'.format(
+                    total, options['rounds'])))
+        finally:
+            DeliveryWindow.objects.filter(order_id__in=order_ids).delete()
+            Order.objects.filter(order_id__in=order_ids).delete()
+            Courier.objects.filter(courier_id__in=courier_ids).delete()
+
+    @staticmethod
+    def assign(courier_id, barrier, given, served, errors):
+        try:
+            barrier.wait()
+            answer, _ = validated_assign_couriers({'courier_id': courier_id})
+            given.extend(order['id'] for order in answer['orders'])
+            if len(answer['orders']) != 0:
+                served.add(courier_id)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
@@ -0,0 +1,86 @@
+"""
+Prometheus metrics of API.
+
+With several worker processes PROMETHEUS_MULTIPROC_DIR should point to an empty directory shared by the workers,
+then every process writes its samples to files there and /metrics aggregates all of them. Backlog of regions and
+cache statistics are read at scrape time, so they are the same whichever worker answers.
+"""
+import os
+from django.db import transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, \
+    generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from . import cache
+
+REQUEST_SECONDS = Histogram('api_request_duration_seconds', 'Time of handling requests by route',
+                            ['route', 'method', 'status'])
+ORDERS = {
+    event: Counter('api_orders_{0}'.format(event), 'Number of {0} orders'.format(event))
+    for event in ('uploaded', 'assigned', 'completed')
+}
+KNAPSACK_ORDERS = Histogram('api_knapsack_orders', 'Number of candidate orders in packing problems',
+                            buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+KNAPSACK_CELLS = Histogram('api_knapsack_cells', 'Candidate orders multiplied by free space in hundredths of kg',
+                           buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8))
+KNAPSACK_SECONDS = Histogram('api_knapsack_duration_seconds', 'Time of solving packing problems',
+                             buckets=(.0001, .0005, .001, .005, .01, .05, .1, .25, .5, 1, 2.5))
+
+
+class StateCollector:
+    """
+    Values read from database and cache on every scrape
+    """
+    def describe(self):
+        return []
+
+    def collect(self):
+        from .models import Order
+        backlog = GaugeMetricFamily('api_backlog_orders', 'Orders that are not assigned yet by region',
+                                    labels=['region'])
+        for region, number in Order.objects.filter(done=False, assigned_to__isnull=True).values('region') \
+                .annotate(number=Count('order_id')).values_list('region', 'number'):
+            backlog.add_metric([str(region)], number)
+        yield backlog
+        profiles = CounterMetricFamily('api_profile_cache', 'Lookups of courier profiles in cache',
+                                       labels=['result'])
+        for result, number in cache.stats().items():
+            profiles.add_metric([result], number)
+        yield profiles
+
+
+def multiprocess_mode():
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ
+
+
+if not multiprocess_mode():
+    REGISTRY.register(StateCollector())
+
+
+def observe_request(route, method, status, seconds):
+    REQUEST_SECONDS.labels(route, method, status).observe(seconds)
+
+
+def observe_solve(orders, space, seconds):
+    KNAPSACK_ORDERS.observe(orders)
+    KNAPSACK_CELLS.observe(orders * max(space, 0))
+    KNAPSACK_SECONDS.observe(seconds)
+
+
+def count_orders(event, number):
+    """
+    Counts orders once the current transaction is committed, rolled back changes are not counted
+    """
+    if number != 0:
+        transaction.on_commit(lambda: ORDERS[event].inc(number))
+
+
+def export(request):
+    if multiprocess_mode():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(StateCollector())
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:30
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+from psycopg2.extras import NumericRange
+
+
+def minute_ranges(gap):
+    """
+    Converts "HH:MM-HH:MM" gap to closed ranges of minutes since midnight, gap passing midnight is split in two.
+    Copy of the function as it was when this migration was written, the app code may change
+    """
+    start, finish = [int(moment[:2]) * 60 + int(moment[3:]) for moment in gap.split('-')]
+    if start <= finish:
+        return [NumericRange(start, finish, '[]')]
+    return [NumericRange(start, 24 * 60 - 1, '[]'), NumericRange(0, finish, '[]')]
+
+
+def fill_windows(apps, schema_editor):
+    Order = apps.get_model('API', 'Order')
+    DeliveryWindow = apps.get_model('API', 'DeliveryWindow')
+    windows = []
+    for order in Order.objects.only('order_id', 'delivery_hours').iterator():
+        for gap in order.delivery_hours:
+            windows.extend(DeliveryWindow(order_id=order.order_id, minutes=minutes) for minutes in minute_ranges(gap))
+    DeliveryWindow.objects.bulk_create(windows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0008_courier_earnings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryWindow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minutes', django.contrib.postgres.fields.ranges.IntegerRangeField(verbose_name='Delivery gap in minutes since midnight')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='windows', to='API.order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deliverywindow',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['minutes'], name='deliverywindow_minutes_gist'),
+        ),
+        migrations.RunPython(fill_windows, migrations.RunPython.noop),
+    ]
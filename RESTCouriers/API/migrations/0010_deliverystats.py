@@ -0,0 +1,46 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    Order = apps.get_model('API', 'Order')
+    DeliveryStats = apps.get_model('API', 'DeliveryStats')
+    stats = {}
+    for order in Order.objects.filter(done=True).order_by('assigned_to', 'region', 'complete_time').iterator():
+        key = (order.assigned_to_id, order.region)
+        if key not in stats:
+            stats[key] = DeliveryStats(courier_id=order.assigned_to_id, region=order.region,
+                                       last_complete_time=order.assign_time)
+        current = stats[key]
+        current.seconds += (order.complete_time - current.last_complete_time).total_seconds()
+        current.count += 1
+        current.last_complete_time = order.complete_time
+    DeliveryStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0009_deliverywindow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.IntegerField(verbose_name='Region of orders')),
+                ('count', models.IntegerField(default=0, verbose_name='Number of completed orders')),
+                ('seconds', models.FloatField(default=0, verbose_name='Sum of delivery times in seconds')),
+                ('last_complete_time', models.DateTimeField(null=True, verbose_name='Time of the latest completion')),
+                ('courier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='API.courier')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='deliverystats',
+            constraint=models.UniqueConstraint(fields=('courier', 'region'), name='deliverystats_courier_region'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
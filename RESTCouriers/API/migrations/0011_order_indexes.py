@@ -0,0 +1,25 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0010_deliverystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('assigned_to__isnull', True), ('done', False)), fields=['region', '-weight'], name='order_free_region_weight'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(done=False), fields=['assigned_to', 'weight'], name='order_open_courier_weight'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(done=True), fields=['assigned_to', 'region', 'complete_time'], name='order_done_courier_region'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+CAPACITIES = {'foot': 10, 'bike': 15, 'car': 50}
+
+
+def fill_batches(apps, schema_editor):
+    Order = apps.get_model('API', 'Order')
+    AssignmentBatch = apps.get_model('API', 'AssignmentBatch')
+    batches = {}
+    for order in Order.objects.filter(done=False, assigned_to__isnull=False).select_related('assigned_to').iterator():
+        if order.assigned_to_id not in batches:
+            batches[order.assigned_to_id] = AssignmentBatch.objects.create(
+                courier_id=order.assigned_to_id, assign_time=order.assign_time,
+                remaining=CAPACITIES.get(order.assigned_to.courier_type, 0) * 100)
+        batch = batches[order.assigned_to_id]
+        batch.assign_time = min(batch.assign_time, order.assign_time)
+        batch.payload += round(order.weight * 100)
+        batch.remaining -= round(order.weight * 100)
+        batch.open_count += 1
+    for batch in batches.values():
+        batch.save()
+        Order.objects.filter(done=False, assigned_to_id=batch.courier_id).update(batch=batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0011_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assign_time', models.DateTimeField(verbose_name='Time of the first assignment of batch')),
+                ('payload', models.IntegerField(default=0, verbose_name='Weight of not completed orders in hundredths of kilogram')),
+                ('remaining', models.IntegerField(default=0, verbose_name='Free space of courier in hundredths of kilogram')),
+                ('open_count', models.IntegerField(default=0, verbose_name='Number of not completed orders')),
+                ('courier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='API.courier')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='batch',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='API.assignmentbatch'),
+        ),
+        migrations.AddConstraint(
+            model_name='assignmentbatch',
+            constraint=models.UniqueConstraint(condition=models.Q(open_count__gt=0), fields=('courier',), name='assignmentbatch_open_courier'),
+        ),
+        migrations.RunPython(fill_batches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:53
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0012_assignmentbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DispatchJob',
+            fields=[
+                ('courier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dispatch_job', serialize=False, to='API.courier')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Time of enqueueing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Offer',
+            fields=[
+                ('courier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='offer', serialize=False, to='API.courier')),
+                ('order_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None)),
+                ('space', models.IntegerField(verbose_name='Free space of courier in hundredths of kilogram the offer is made for')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Time of computing')),
+            ],
+        ),
+    ]
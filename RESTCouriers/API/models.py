@@ -1,5 +1,29 @@
 from django.db import models
-from django.contrib.postgres.fields import ArrayField
+from django.db.models import Case, F, Value, When
+from django.contrib.postgres.fields import ArrayField, IntegerRangeField
+from django.contrib.postgres.indexes import GistIndex
+from psycopg2.extras import NumericRange
+from . import intervals
+
+# Carrying capacity of every type of courier in kilograms
+CAPACITIES = {'foot': 10, 'bike': 15, 'car': 50}
+# Payment for one completed order is 500 multiplied by coefficient of type of courier
+EARNING_FACTORS = {'foot': 2, 'bike': 5, 'car': 9}
+
+
+def earning(courier_type):
+    return 500 * EARNING_FACTORS[courier_type]
+
+
+def hundredths(weight):
+    return round(weight * 100)
+
+
+def hours_ranges(gaps):
+    """
+    Closed ranges of minutes of list of gaps with overlapping and adjacent gaps merged
+    """
+    return [NumericRange(start, finish, '[]') for start, finish in intervals.hours(gaps)]
 
 
 class Courier(models.Model):
@@ -19,3 +43,178 @@ class Order(models.Model):
     assign_time = models.DateTimeField('Time of assignment', null=True)
     complete_time = models.DateTimeField('Time of completion', null=True)
     assigned_to = models.ForeignKey(Courier, on_delete=models.CASCADE, null=True)
+    batch = models.ForeignKey('AssignmentBatch', on_delete=models.SET_NULL, null=True, related_name='orders')
+
+    class Meta:
+        indexes = [
+            # Candidates for assignment, heaviest first
+            models.Index(fields=['region', '-weight'], name='order_free_region_weight',
+                         condition=models.Q(done=False, assigned_to__isnull=True)),
+            # Release of the lightest orders when courier changes
+            models.Index(fields=['assigned_to', 'weight'], name='order_open_courier_weight',
+                         condition=models.Q(done=False)),
+            # Completed orders of courier by region in order of completion for rating
+            models.Index(fields=['assigned_to', 'region', 'complete_time'], name='order_done_courier_region',
+                         condition=models.Q(done=True)),
+        ]
+
+
+class DeliveryWindow(models.Model):
+    """
+    Delivery hours of order as integer ranges so orders fitting working hours could be found by index
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='windows')
+    minutes = IntegerRangeField('Delivery gap in minutes since midnight')
+
+    class Meta:
+        indexes = [GistIndex(fields=['minutes'], name='deliverywindow_minutes_gist')]
+
+    @staticmethod
+    def overlap_q(working_hours):
+        """
+        Condition on windows that intersect any of working hours, it is empty if there are no working hours
+        """
+        condition = models.Q()
+        for minutes in hours_ranges(working_hours):
+            condition |= models.Q(minutes__overlap=minutes)
+        return condition
+
+    @staticmethod
+    def for_order(order):
+        return [DeliveryWindow(order=order, minutes=minutes) for minutes in hours_ranges(order.delivery_hours)]
+
+
+class DeliveryStats(models.Model):
+    """
+    Running totals of orders completed by courier in one region, rating is built from them
+    """
+    courier = models.ForeignKey(Courier, on_delete=models.CASCADE, related_name='stats')
+    region = models.IntegerField('Region of orders')
+    count = models.IntegerField('Number of completed orders', default=0)
+    seconds = models.FloatField('Sum of delivery times in seconds', default=0)
+    last_complete_time = models.DateTimeField('Time of the latest completion', null=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['courier', 'region'], name='deliverystats_courier_region')]
+
+    @staticmethod
+    def add(*orders):
+        """
+        Accounts just completed orders. Delivery time is counted from previous completion in the region or from
+        assignment for the first one, completion earlier than the latest known makes totals to be recounted
+        """
+        groups = {}
+        for order in sorted(orders, key=lambda order: order.complete_time):
+            groups.setdefault((order.assigned_to_id, order.region), []).append(order)
+        # Rows are locked in the same order by everybody
+        for (courier_id, region), group in sorted(groups.items(), key=lambda item: item[0]):
+            stats, _ = DeliveryStats.objects.select_for_update().get_or_create(courier_id=courier_id, region=region)
+            if stats.last_complete_time is not None and group[0].complete_time < stats.last_complete_time:
+                stats.recount()
+            else:
+                for order in group:
+                    start = order.assign_time if stats.last_complete_time is None else stats.last_complete_time
+                    stats.seconds += (order.complete_time - start).total_seconds()
+                    stats.count += 1
+                    stats.last_complete_time = order.complete_time
+            stats.save()
+
+    def recount(self):
+        self.count, self.seconds, self.last_complete_time = 0, 0, None
+        for order in Order.objects.filter(assigned_to=self.courier_id, region=self.region, done=True).order_by(
+                'complete_time'):
+            start = order.assign_time if self.last_complete_time is None else self.last_complete_time
+            self.seconds += (order.complete_time - start).total_seconds()
+            self.count += 1
+            self.last_complete_time = order.complete_time
+
+
+class AssignmentBatch(models.Model):
+    """
+    Orders given to courier and not completed yet, so free space of courier is read from one row. Batch is open while
+    it has orders to deliver, the next assignment after that starts a new batch
+    """
+    courier = models.ForeignKey(Courier, on_delete=models.CASCADE, related_name='batches')
+    assign_time = models.DateTimeField('Time of the first assignment of batch')
+    payload = models.IntegerField('Weight of not completed orders in hundredths of kilogram', default=0)
+    remaining = models.IntegerField('Free space of courier in hundredths of kilogram', default=0)
+    open_count = models.IntegerField('Number of not completed orders', default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['courier'], condition=models.Q(open_count__gt=0),
+                                               name='assignmentbatch_open_courier')]
+
+    @staticmethod
+    def open_batches(courier_ids):
+        return {batch.courier_id: batch for batch in
+                AssignmentBatch.objects.filter(courier_id__in=courier_ids, open_count__gt=0)}
+
+    @staticmethod
+    def space(courier, batch):
+        """
+        Free space of courier in hundredths of kilogram
+        """
+        return batch.remaining if batch is not None else CAPACITIES.get(courier.courier_type, 0) * 100
+
+    @staticmethod
+    def add(courier, batch, orders, assign_time):
+        """
+        Puts just assigned orders to open batch of courier or to a new one and returns the batch. Courier should be
+        locked, completions could still change the batch at the same time so it's changed relatively
+        """
+        weight = sum(hundredths(order.weight) for order in orders)
+        if batch is None:
+            return AssignmentBatch.objects.create(
+                courier=courier, assign_time=assign_time, payload=weight, open_count=len(orders),
+                remaining=CAPACITIES.get(courier.courier_type, 0) * 100 - weight)
+        AssignmentBatch.objects.filter(pk=batch.pk).update(payload=F('payload') + weight,
+                                                           remaining=F('remaining') - weight,
+                                                           open_count=F('open_count') + len(orders))
+        return batch
+
+    @staticmethod
+    def remove(orders):
+        """
+        Takes completed or released orders out of their batches with one update
+        """
+        changes = {}
+        for order in orders:
+            if order.batch_id is not None:
+                count, weight = changes.get(order.batch_id, (0, 0))
+                changes[order.batch_id] = (count + 1, weight + hundredths(order.weight))
+        if len(changes) == 0:
+            return
+
+        def change(index):
+            return Case(*[When(pk=batch_id, then=Value(values[index])) for batch_id, values in changes.items()],
+                        output_field=models.IntegerField())
+        AssignmentBatch.objects.filter(pk__in=list(changes)).update(payload=F('payload') - change(1),
+                                                                    remaining=F('remaining') + change(1),
+                                                                    open_count=F('open_count') - change(0))
+
+    @staticmethod
+    def recast(courier):
+        """
+        Recounts free space of open batch after type of courier is changed
+        """
+        AssignmentBatch.objects.filter(courier=courier, open_count__gt=0).update(
+            remaining=CAPACITIES.get(courier.courier_type, 0) * 100 - F('payload'))
+
+
+class DispatchJob(models.Model):
+    """
+    Courier whose offer should be computed again by dispatcher, there is at most one job for courier
+    """
+    courier = models.OneToOneField(Courier, on_delete=models.CASCADE, primary_key=True, related_name='dispatch_job')
+    created = models.DateTimeField('Time of enqueueing', auto_now_add=True)
+
+
+class Offer(models.Model):
+    """
+    Orders dispatcher packed for courier in advance, it's valid while courier has the same free space and all the
+    orders are still free
+    """
+    courier = models.OneToOneField(Courier, on_delete=models.CASCADE, primary_key=True, related_name='offer')
+    order_ids = ArrayField(models.IntegerField())
+    space = models.IntegerField('Free space of courier in hundredths of kilogram the offer is made for')
+    created = models.DateTimeField('Time of computing', auto_now_add=True)
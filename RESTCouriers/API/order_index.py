@@ -0,0 +1,268 @@
+"""
+In-process index of orders waiting for assignment.
+
+Every region keeps delivery windows sorted by start and orders sorted from the heaviest one, so candidates for courier
+are found without scanning the table. Write paths send ids of changed orders with NOTIFY inside their transaction, so
+every process gets them once the change is committed. A listener thread of every process builds the index and reads
+the notified orders again, changes of this process are also applied right after commit. Until the index is built,
+and again after the listener lost its connection, assignment searches the database. Index only proposes candidates,
+assignment still locks them and checks in the database that they are free.
+"""
+import bisect
+import logging
+import os
+import select
+import threading
+from heapq import merge
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models.signals import post_save
+from . import intervals
+from .models import Order, DeliveryWindow
+
+logger = logging.getLogger(__name__)
+CHANNEL = 'order_index'
+# Payload of NOTIFY has to be shorter than 8000 bytes
+PAYLOAD_SIZE = 7000
+index = None
+index_lock = threading.Lock()
+listener = None
+
+
+class RegionIndex:
+    def __init__(self):
+        self.windows = []
+        self.by_weight = []
+        self.longest = 0
+
+    def add(self, order_id, weight, minutes):
+        bisect.insort(self.by_weight, (-weight, order_id))
+        for start, finish in minutes:
+            bisect.insort(self.windows, (start, finish, order_id))
+            self.longest = max(self.longest, finish - start)
+
+    def remove(self, order_id, weight, minutes):
+        del self.by_weight[bisect.bisect_left(self.by_weight, (-weight, order_id))]
+        for start, finish in minutes:
+            del self.windows[bisect.bisect_left(self.windows, (start, finish, order_id))]
+
+    def overlapping(self, start, finish):
+        """
+        Ids of orders with a window sharing a minute with [start, finish]
+        """
+        low = bisect.bisect_left(self.windows, (start - self.longest,))
+        high = bisect.bisect_right(self.windows, (finish, float('inf')))
+        return (order_id for window_start, window_finish, order_id in self.windows[low:high]
+                if window_finish >= start)
+
+
+class OrderIndex:
+    def __init__(self):
+        self.regions = {}
+        self.orders = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def build():
+        built = OrderIndex()
+        windows = {}
+        for order_id, minutes in DeliveryWindow.objects.filter(
+                order__done=False, order__assigned_to__isnull=True).values_list('order_id', 'minutes').iterator():
+            windows.setdefault(order_id, []).append(intervals.from_range(minutes))
+        for order_id, region, weight in Order.objects.filter(done=False, assigned_to__isnull=True).values_list(
+                'order_id', 'region', 'weight').iterator():
+            built.add(order_id, region, weight, intervals.normalize(windows.get(order_id, [])))
+        return built
+
+    def refresh(self, order_ids):
+        """
+        Reads orders from database again, free ones are put to the index and the rest are taken out of it
+        """
+        windows = {}
+        for order_id, minutes in DeliveryWindow.objects.filter(order_id__in=order_ids).values_list(
+                'order_id', 'minutes'):
+            windows.setdefault(order_id, []).append(intervals.from_range(minutes))
+        free = Order.objects.filter(order_id__in=order_ids, done=False, assigned_to__isnull=True).values_list(
+            'order_id', 'region', 'weight')
+        with self.lock:
+            for order_id in order_ids:
+                self.remove(order_id)
+            for order_id, region, weight in free:
+                self.add(order_id, region, weight, intervals.normalize(windows.get(order_id, [])))
+
+    def add(self, order_id, region, weight, minutes):
+        with self.lock:
+            if order_id in self.orders:
+                self.remove(order_id)
+            self.orders[order_id] = (region, weight, minutes)
+            self.regions.setdefault(region, RegionIndex()).add(order_id, weight, minutes)
+
+    def remove(self, order_id):
+        with self.lock:
+            if order_id in self.orders:
+                region, weight, minutes = self.orders.pop(order_id)
+                self.regions[region].remove(order_id, weight, minutes)
+
+    def candidates(self, regions, working_hours, space):
+        """
+        Ids of orders of regions fitting working hours and space hundredths of kilogram, heaviest first
+        """
+        with self.lock:
+            indexes = [self.regions[region] for region in set(regions) if region in self.regions]
+            eligible = set(order_id for region in indexes for start, finish in intervals.hours(working_hours)
+                           for order_id in region.overlapping(start, finish))
+            # Orders heavier than space are skipped by bisect in every region
+            heaviest = (space + 1) / 100
+            return [order_id for _, order_id in merge(*(
+                region.by_weight[bisect.bisect_right(region.by_weight, (-heaviest, float('inf'))):]
+                for region in indexes)) if order_id in eligible]
+
+
+def enabled():
+    return settings.ORDER_INDEX
+
+
+def get():
+    """
+    Index of this process or None while it's not built, the first call starts the listener thread that builds it
+    """
+    global listener
+    with index_lock:
+        if listener is None:
+            listener = Listener()
+            listener.start()
+        return index
+
+
+def stop():
+    """
+    Stops the listener and drops the index, the next get() starts them again
+    """
+    global listener, index
+    with index_lock:
+        stopped, listener, index = listener, None, None
+    if stopped is not None:
+        stopped.stop()
+
+
+class Listener(threading.Thread):
+    """
+    Builds the index after LISTEN, so changes committed after its snapshot are notified, and applies notified ids.
+    Notifications sent while the connection was lost are missed, so the index is dropped and built again
+    """
+    def __init__(self):
+        super().__init__(name='order-index', daemon=True)
+        self.stopped = threading.Event()
+        # Writing to the pipe wakes the thread waiting for notifications
+        self.wakeup, self.waker = os.pipe()
+
+    def stop(self):
+        self.stopped.set()
+        os.write(self.waker, b'.')
+        self.join()
+        os.close(self.wakeup)
+        os.close(self.waker)
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.listen()
+                except Exception:
+                    logger.exception('Listener of order changes failed, index is built again')
+                    self.publish(None)
+                    close_old_connections()
+                    self.stopped.wait(1)
+        finally:
+            connections.close_all()
+
+    def publish(self, built):
+        global index
+        with index_lock:
+            if listener is self:
+                index = built
+
+    def listen(self):
+        feed = psycopg2.connect(**connections['default'].get_connection_params())
+        try:
+            feed.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with feed.cursor() as cursor:
+                cursor.execute('LISTEN ' + CHANNEL)
+            built = OrderIndex.build()
+            self.publish(built)
+            close_old_connections()
+            while not self.stopped.is_set():
+                if select.select([feed, self.wakeup], [], [], settings.ORDER_INDEX_PING) == ([], [], []):
+                    # Nothing came for a while, a query finds out whether the connection is still alive
+                    with feed.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                feed.poll()
+                order_ids = set()
+                while feed.notifies:
+                    order_ids.update(int(order_id) for order_id in feed.notifies.pop().payload.split(','))
+                if len(order_ids) != 0:
+                    built.refresh(order_ids)
+                    close_old_connections()
+        finally:
+            feed.close()
+
+
+def notify(order_ids):
+    """
+    Sends ids of changed orders to listeners of all processes, they get them when the transaction is committed
+    """
+    payload = []
+    size = 0
+    with connection.cursor() as cursor:
+        for order_id in order_ids:
+            payload.append(str(order_id))
+            size += len(payload[-1]) + 1
+            if size >= PAYLOAD_SIZE:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, ','.join(payload)])
+                payload = []
+                size = 0
+        if len(payload) != 0:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, ','.join(payload)])
+
+
+def orders_added(orders):
+    """
+    Notifies orders that became free, this process puts them to its index after commit
+    """
+    if enabled():
+        notify([order.order_id for order in orders])
+        entries = [(order.order_id, order.region, order.weight, intervals.hours(order.delivery_hours))
+                   for order in orders]
+        transaction.on_commit(lambda: apply(OrderIndex.add, entries))
+
+
+def orders_removed(order_ids):
+    """
+    Notifies assigned orders, this process takes them out of its index after commit
+    """
+    if enabled():
+        notify(order_ids)
+        entries = [(order_id,) for order_id in order_ids]
+        transaction.on_commit(lambda: apply(OrderIndex.remove, entries))
+
+
+def apply(change, entries):
+    # Index that is not built yet will read everything from database
+    current = index
+    if current is not None:
+        for entry in entries:
+            change(current, *entry)
+
+
+def order_saved(sender, instance, **kwargs):
+    if instance.done or instance.assigned_to_id is not None:
+        orders_removed([instance.order_id])
+    else:
+        orders_added([instance])
+
+
+# Signal covers single saves, bulk writes call the hooks above. Deleted orders stay in the index till it's built again
+# and are dropped by the check in database, a delete receiver would make every bulk delete of orders load them
+post_save.connect(order_saved, sender=Order)
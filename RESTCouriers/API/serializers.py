@@ -1,9 +1,11 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Courier, Order
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from .models import Courier, Order, AssignmentBatch, DeliveryWindow, DeliveryStats, CAPACITIES, earning, hundredths
+from . import cache, dispatch, intervals, metrics, order_index, validators
 import time
 from dateutil.tz import UTC
-import datetime
 
 
 def is_correct_time(time_str):
@@ -25,37 +27,67 @@ class CourierSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return Courier.objects.create(**validated_data)
 
+    @staticmethod
+    def bulk_create(instances, batch_size):
+        return Courier.objects.bulk_create(instances, batch_size=batch_size)
+
+    @staticmethod
+    def fast_validated_data(item):
+        """
+        Validated data of uploaded courier without the full validation or None if it is needed
+        """
+        return validators.courier_data(item)
+
     def update(self, instance, validated_data):
         """
         Updates info about courier
         """
-        types = {'foot': 10, 'bike': 15, 'car': 50}
-        old_type = instance.courier_type
-        instance.courier_type = self.validated_data.get('courier_type', instance.courier_type)
-        instance.regions = self.validated_data.get('regions', instance.regions)
-        instance.working_hours = self.validated_data.get('working_hours', instance.working_hours)
-        instance.save()
-        # Recasting orders if new info
-        for order in Order.objects.filter(done=False).filter(assigned_to=instance):
-            if order.region not in instance.regions:
-                order.assign_time = None
-                order.assigned_to = None
-                order.save()
-            elif not any(
-                    CourierSerializer.hours_intersect(delivery_gap, instance.working_hours) for delivery_gap in
-                    order.delivery_hours):
-                order.assign_time = None
-                order.assigned_to = None
-                order.save()
-            elif types[old_type] > types[instance.courier_type]:
-                while types[instance.courier_type] - sum(
-                        order.weight for order in Order.objects.filter(assigned_to=instance)) < 0:
-                    order = Order.objects.filter(assigned_to=instance).order_by('weight')[0]
-                    order.assign_time = None
-                    order.assigned_to = None
-                    order.save()
+        with transaction.atomic():
+            courier_type = instance.courier_type
+            instance.courier_type = self.validated_data.get('courier_type', instance.courier_type)
+            instance.regions = self.validated_data.get('regions', instance.regions)
+            instance.working_hours = self.validated_data.get('working_hours', instance.working_hours)
+            # Earnings are only ever incremented in the database, instance loaded before may have an old value
+            instance.save(update_fields=['courier_type', 'regions', 'working_hours'])
+            cache.invalidate(instance.courier_id)
+            # Recasting orders if new info
+            released = self.orders_to_release(instance)
+            Order.objects.filter(order_id__in=[order.order_id for order in released]).update(
+                assign_time=None, assigned_to=None, batch=None)
+            AssignmentBatch.remove(released)
+            order_index.orders_added(released)
+            dispatch.enqueue([instance.courier_id])
+            dispatch.enqueue_regions(set(order.region for order in released))
+            if courier_type != instance.courier_type:
+                AssignmentBatch.recast(instance)
         return instance
 
+    @staticmethod
+    def orders_to_release(instance):
+        """
+        Open orders of courier that are out of its regions or working hours and the lightest ones that don't fit its
+        capacity any more
+        """
+        fits_hours = DeliveryWindow.overlap_q(instance.working_hours)
+        orders = Order.objects.filter(done=False, assigned_to=instance).select_for_update()
+        if len(fits_hours) != 0:
+            orders = orders.annotate(
+                fits_hours=Exists(DeliveryWindow.objects.filter(order=OuterRef('pk')).filter(fits_hours)))
+        released = []
+        kept = []
+        for order in orders.order_by('weight'):
+            if order.region in instance.regions and getattr(order, 'fits_hours', False):
+                kept.append(order)
+            else:
+                released.append(order)
+        payload = sum(hundredths(order.weight) for order in kept)
+        for order in kept:
+            if payload <= CAPACITIES[instance.courier_type] * 100:
+                break
+            payload -= hundredths(order.weight)
+            released.append(order)
+        return released
+
     def is_valid(self, raise_exception=True):
         """
         Validating of input data
@@ -113,18 +145,9 @@ class CourierSerializer(serializers.ModelSerializer):
     @staticmethod
     def hours_intersect(delivery_gap, working_hours):
         """
-        Here we check if delivery gap of customer intersects with working hours of courier so he could deliver it
-        """
-        for working_gap in working_hours:
-            finish_is_later = datetime.datetime.strptime(working_gap.split('-')[1],
-                                                         '%H:%M') >= datetime.datetime.strptime(
-                delivery_gap.split('-')[0], '%H:%M')
-            start_is_earlier = datetime.datetime.strptime(working_gap.split('-')[0],
-                                                          '%H:%M') <= datetime.datetime.strptime(
-                delivery_gap.split('-')[1], '%H:%M')
-            if start_is_earlier and finish_is_later:
-                return True
-        return False
+        Here we check if delivery gap of customer intersects with working hours of courier so it could be delivered
+        """
+        return intervals.intersects(intervals.hours([delivery_gap]), intervals.hours(working_hours))
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -133,20 +156,50 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['order_id', 'weight', 'region', 'delivery_hours', 'done', 'complete_time']
 
     def create(self, validated_data):
-        return Order.objects.create(**validated_data)
+        order = Order.objects.create(**validated_data)
+        DeliveryWindow.objects.bulk_create(DeliveryWindow.for_order(order))
+        dispatch.enqueue_regions([order.region])
+        return order
+
+    @staticmethod
+    def bulk_create(instances, batch_size):
+        """
+        Creates orders together with their delivery windows
+        """
+        orders = Order.objects.bulk_create(instances, batch_size=batch_size)
+        DeliveryWindow.objects.bulk_create([window for order in orders for window in DeliveryWindow.for_order(order)],
+                                           batch_size=batch_size)
+        order_index.orders_added(orders)
+        dispatch.enqueue_regions(set(order.region for order in orders))
+        return orders
+
+    @staticmethod
+    def fast_validated_data(item):
+        """
+        Validated data of uploaded order without the full validation or None if it is needed
+        """
+        return validators.order_data(item)
 
     def update(self, instance, validated_data):
         """
         Updates info about courier
         """
-        types = {'foot': 2, 'bike': 5, 'car': 9}
         if not instance.done:
-            instance.complete_time = validated_data.get('complete_time').astimezone(UTC)
-            instance.done = True
-            courier = instance.assigned_to
-            courier.earnings += 500 * types[courier.courier_type]
-            courier.save()
-            instance.save()
+            with transaction.atomic():
+                complete_time = validated_data.get('complete_time').astimezone(UTC)
+                # Courier is locked before its orders like in assignment and update of courier, so they can't deadlock
+                courier = Courier.objects.select_for_update().get(courier_id=instance.assigned_to_id)
+                # Only the first of concurrent completions of the order finds it open and pays the courier
+                if Order.objects.filter(order_id=instance.order_id, done=False, assigned_to=courier).update(
+                        done=True, complete_time=complete_time):
+                    instance.complete_time = complete_time
+                    instance.done = True
+                    Courier.objects.filter(courier_id=courier.courier_id).update(
+                        earnings=F('earnings') + earning(courier.courier_type))
+                    DeliveryStats.add(instance)
+                    AssignmentBatch.remove([instance])
+                    metrics.count_orders('completed', 1)
+                    cache.invalidate(courier.courier_id)
         return instance
 
     def is_valid(self, raise_exception=True):
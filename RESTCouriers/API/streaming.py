@@ -0,0 +1,171 @@
+"""
+Incremental readers of upload bodies and writers of long responses, items are taken from request stream and written
+to response one by one so memory doesn't grow with size of the body.
+"""
+import codecs
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.parsers import ParseError
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class JSONReader:
+    """
+    Reads JSON values from a stream of bytes keeping in memory only the part that is not parsed yet
+    """
+    decoder = json.JSONDecoder()
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self, size=CHUNK_SIZE):
+        """
+        Reads at least size more bytes, size grows with unparsed part so long values are read in linear time
+        """
+        if self.position > CHUNK_SIZE:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        chunk = self.stream.read(max(size, len(self.buffer) - self.position))
+        if not chunk:
+            self.eof = True
+        try:
+            self.buffer += self.utf8.decode(chunk, final=self.eof)
+        except UnicodeDecodeError:
+            raise ParseError('Body is not in UTF-8')
+
+    def peek(self):
+        """
+        Next character that is not whitespace, empty string at the end of stream
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+            self.fill()
+
+    def expect(self, characters):
+        character = self.peek()
+        if character == '' or character not in characters:
+            raise ParseError('Expected one of "{0}"'.format(characters))
+        self.position += 1
+        return character
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # Number at the very end of buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ParseError('Impossible to parse to JSON')
+            self.fill()
+
+
+def is_streamed(request):
+    """
+    Upload is read right from request stream for NDJSON bodies and for JSON ones posted with ?stream=1
+    """
+    return request.content_type == 'application/x-ndjson' or request.GET.get('stream') == '1'
+
+
+def iter_json_items(stream, key):
+    """
+    Yields items of the array under key of JSON object read from stream
+    """
+    reader = JSONReader(stream)
+    reader.expect('{')
+    found = False
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            name = reader.value()
+            if not isinstance(name, str):
+                raise ParseError('Impossible to parse to JSON')
+            reader.expect(':')
+            if name == key and not found:
+                found = True
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.expect(',]') == ']':
+                            break
+            else:
+                reader.value()
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek() != '':
+        raise ParseError('Extra data after JSON object')
+    if not found:
+        raise ParseError('There is no {0} array'.format(key))
+
+
+def iter_ndjson_items(stream, size=CHUNK_SIZE):
+    """
+    Yields items of newline delimited JSON, every non empty line is an item. The stream is read in chunks of size
+    bytes because reading it by lines copies the rest of the read buffer for every line
+    """
+    rest = b''
+    while True:
+        chunk = stream.read(size)
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop() if chunk else b''
+        for line in lines:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    raise ParseError('Impossible to parse to JSON')
+        if not chunk:
+            return
+
+
+def created_content(key, ids, size=CHUNK_SIZE):
+    """
+    Yields the same body JsonResponse({key: [{'id': id}, ...]}) has in parts of about size bytes
+    """
+    yield '{{{0}: ['.format(json.dumps(key))
+    part = []
+    length = 0
+    for index, item_id in enumerate(ids):
+        piece = '{0}{{"id": {1}}}'.format('' if index == 0 else ', ', json.dumps(item_id))
+        part.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(part)
+            part = []
+            length = 0
+    yield ''.join(part) + ']}'
+
+
+def ndjson_content(rows, size=CHUNK_SIZE):
+    """
+    Yields rows as newline delimited JSON in parts of about size bytes
+    """
+    part = []
+    length = 0
+    for row in rows:
+        line = json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        part.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(part)
+            part = []
+            length = 0
+    if part:
+        yield ''.join(part)
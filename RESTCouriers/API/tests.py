@@ -1,3 +1,602 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import json
+import random
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from . import allocation, apps, dispatch, idempotency, instrumentation, intervals, order_index, validators, views
+from .generator import DataGenerator
+from .management.commands.bench_intervals import strptime_intersect
+from .models import Courier, Order, AssignmentBatch, DeliveryStats, DispatchJob, Offer
+from .serializers import CourierSerializer, OrderSerializer
 
-# Create your tests here.
+
+def table_knapsack(space, weights):
+    """
+    The original table based knapsack, exact solvers have to choose the same orders
+    """
+    matrix = [[0 for _ in range(space + 1)] for _ in range(len(weights) + 1)]
+    for k in range(1, len(weights) + 1):
+        for s in range(1, space + 1):
+            if s >= weights[k - 1]:
+                matrix[k][s] = max(matrix[k - 1][s], matrix[k - 1][s - weights[k - 1]] + weights[k - 1])
+            else:
+                matrix[k][s] = matrix[k - 1][s]
+    taken = []
+    k, s = len(weights), space
+    while matrix[k][s] != 0:
+        if matrix[k - 1][s] != matrix[k][s]:
+            taken.append(k - 1)
+            s -= weights[k - 1]
+        k -= 1
+    taken.reverse()
+    return taken
+
+
+def sorted_walk_rating(courier):
+    """
+    The original rating: completed orders of every region are walked in order of completion
+    """
+    time_by_reg = []
+    for region in courier.regions:
+        orders = list(Order.objects.filter(region=region, done=True, assigned_to=courier).order_by('complete_time'))
+        if len(orders) != 0:
+            sum_sec = (orders[0].complete_time - orders[0].assign_time).total_seconds()
+            for previous, order in zip(orders, orders[1:]):
+                sum_sec += (order.complete_time - previous.complete_time).total_seconds()
+            time_by_reg.append(sum_sec / len(orders))
+    if len(time_by_reg) == 0:
+        return None
+    return round((60 * 60 - min(min(time_by_reg), 60 * 60)) / (60 * 60) * 5, 2)
+
+
+def day_gap(rng):
+    start = rng.randrange(24 * 60)
+    finish = rng.randrange(start, 24 * 60)
+    return '{0:02d}:{1:02d}-{2:02d}:{3:02d}'.format(start // 60, start % 60, finish // 60, finish % 60)
+
+
+class SolverTests(SimpleTestCase):
+    def test_exact_solvers_match_table_knapsack(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            space = rng.choice([0, 1, 7, 100, 1000, 1500])
+            weights = sorted((rng.randint(1, 5000) // rng.choice([1, 10, 100]) or 1 for _ in range(rng.randint(0, 30))),
+                             reverse=True)
+            expected = table_knapsack(space, weights)
+            for strategy in ('bitset', 'numpy', 'bounded'):
+                with self.subTest(strategy=strategy, space=space, weights=weights):
+                    self.assertEqual(allocation.SOLVERS[strategy](space, weights), expected)
+
+    def test_reused_rows_match_table_knapsack(self):
+        rng = random.Random(2)
+        backlog = {order_id: rng.randint(1, 1500) for order_id in range(40)}
+        with mock.patch.object(allocation, 'row_cache', allocation.RowCache(10 ** 8)):
+            for call in range(200):
+                space = rng.choice([1000, 1500, 5000, 37])
+                keys = sorted(((order_id, weight) for order_id, weight in backlog.items() if weight <= space),
+                              key=lambda key: (-key[1], key[0]))
+                weights = [weight for _, weight in keys]
+                chosen = allocation.incremental_knapsack('scope', keys, space, weights)
+                self.assertEqual(chosen, table_knapsack(space, weights), (call, space))
+                for index in chosen[:rng.randint(0, 2)]:
+                    del backlog[keys[index][0]]
+                backlog[40 + call] = rng.randint(1, 1500)
+
+    def test_rows_are_reused_for_smaller_space(self):
+        keys = [(1, 3000), (2, 1200), (3, 700), (4, 700), (5, 20)]
+        with mock.patch.object(allocation, 'row_cache', allocation.RowCache(10 ** 8)):
+            allocation.incremental_knapsack('scope', keys, 5000, [weight for _, weight in keys])
+            # Orders heavier than 1000 are not candidates of the smaller space, rows after them are reused
+            self.assertEqual(allocation.incremental_knapsack('scope', [(3, 700), (4, 700), (6, 10)], 1000,
+                                                             [700, 700, 10]), [0, 2])
+            self.assertEqual(allocation.row_cache.reused_rows, 2)
+            # The row computed for 1000 is not exact for 5000, the ones before it are
+            keys = keys[:4] + [(6, 10)]
+            self.assertEqual(allocation.incremental_knapsack('scope', keys, 5000, [weight for _, weight in keys]),
+                             table_knapsack(5000, [weight for _, weight in keys]))
+            self.assertEqual(allocation.row_cache.reused_rows, 2 + 4)
+
+    def test_greedy_fits_in_space(self):
+        rng = random.Random(1)
+        for _ in range(100):
+            space = rng.randint(0, 5000)
+            weights = sorted((rng.randint(1, 5000) for _ in range(20)), reverse=True)
+            self.assertLessEqual(sum(weights[index] for index in allocation.greedy_knapsack(space, weights)), space)
+
+    @override_settings(ALLOCATION_STRATEGIES={'foot': 'bitset', 'bike': 'numpy', 'car': 'numpy'})
+    def test_numpy_strategy_without_numpy_is_reported(self):
+        if allocation.numpy is not None:
+            self.assertEqual(apps.check_allocation_strategies(None), [])
+        with mock.patch.object(allocation, 'numpy', None):
+            self.assertEqual([(warning.id, warning.hint) for warning in apps.check_allocation_strategies(None)],
+                             [('API.W002', 'Install numpy or set ALLOCATION_BIKE to bitset'),
+                              ('API.W002', 'Install numpy or set ALLOCATION_CAR to bitset')])
+
+
+class IntervalTests(SimpleTestCase):
+    def test_intersects_matches_strptime_check(self):
+        rng = random.Random(0)
+        for _ in range(5000):
+            delivery_gap = day_gap(rng)
+            working_hours = [day_gap(rng) for _ in range(rng.randint(0, 3))]
+            self.assertEqual(intervals.intersects(intervals.hours([delivery_gap]), intervals.hours(working_hours)),
+                             strptime_intersect(delivery_gap, working_hours), (delivery_gap, working_hours))
+
+    def test_gap_passing_midnight(self):
+        night = intervals.hours(['22:00-02:00'])
+        self.assertEqual(night, ((0, 120), (1320, 1439)))
+        self.assertTrue(intervals.intersects(night, intervals.hours(['01:00-01:30'])))
+        self.assertFalse(intervals.intersects(night, intervals.hours(['03:00-21:59'])))
+
+
+class WeightTests(TestCase):
+    def test_assigned_orders_fit_courier(self):
+        # 0.29 kg is 28.999... hundredths in floating point, it has to count as 29
+        Courier.objects.create(courier_id=1, courier_type='foot', regions=[1], working_hours=['09:00-18:00'])
+        OrderSerializer.bulk_create([Order(order_id=order_id, weight=0.29, region=1, delivery_hours=['10:00-11:00'])
+                                     for order_id in range(1, 41)], 100)
+        answer, _ = views.validated_assign_couriers({'courier_id': 1})
+        self.assertEqual(len(answer['orders']), 34)
+        self.assertEqual(AssignmentBatch.objects.get(courier_id=1).remaining, 1000 - 34 * 29)
+
+
+class InstrumentationTests(SimpleTestCase):
+    def run_queries(self, request_metrics):
+        token = instrumentation.current.set(request_metrics)
+        try:
+            for sql, params in (('SELECT %s', (1,)), ('SELECT %s', (1,)), ('SELECT %s', (2,)), ('SELECT 1', None)):
+                instrumentation.measure_query(lambda *args: None, sql, params, False, {})
+        finally:
+            instrumentation.current.reset(token)
+
+    def test_not_sampled_request_keeps_only_counters(self):
+        request_metrics = instrumentation.RequestMetrics(sampled=False)
+        self.run_queries(request_metrics)
+        self.assertEqual((request_metrics.count, request_metrics.duplicates, request_metrics.queries), (4, 1, []))
+
+    def test_sampled_request_keeps_limited_list(self):
+        request_metrics = instrumentation.RequestMetrics(sampled=True)
+        with mock.patch.object(instrumentation, 'QUERY_LIST_LIMIT', 3):
+            self.run_queries(request_metrics)
+        self.assertEqual(request_metrics.count, 4)
+        self.assertEqual([sql for sql, _, _ in request_metrics.queries], ['SELECT %s'] * 3)
+
+
+class CompletionTests(TestCase):
+    def setUp(self):
+        Courier.objects.create(courier_id=1, courier_type='foot', regions=[1], working_hours=['09:00-18:00'])
+        Courier.objects.create(courier_id=2, courier_type='car', regions=[1], working_hours=['09:00-18:00'])
+        # Orders 1, 2, 3 go to the foot courier and 4, 5 to the car one
+        for courier_id, order_ids in ((1, range(1, 4)), (2, range(4, 6))):
+            OrderSerializer.bulk_create([Order(order_id=order_id, weight=1, region=1, delivery_hours=['10:00-11:00'])
+                                         for order_id in order_ids], 100)
+            views.validated_assign_couriers({'courier_id': courier_id})
+
+    def post(self, view, data):
+        request = RequestFactory().post('/', json.dumps(data), content_type='application/json')
+        return view(request)
+
+    def test_courier_id_may_be_string(self):
+        response = self.post(views.complete_order,
+                             {'courier_id': '1', 'order_id': 1, 'complete_time': '2021-01-10T10:33:01.42Z'})
+        self.assertEqual((response.status_code, json.loads(response.content)), (200, {'order_id': 1}))
+        self.assertEqual(Courier.objects.get(courier_id=1).earnings, 1000)
+
+    def complete_batch(self, *records):
+        response = self.post(views.complete_orders_batch, {'data': [
+            {'courier_id': courier_id, 'order_id': order_id, 'complete_time': '2021-01-10T10:33:01.42Z'}
+            for courier_id, order_id in records]})
+        return response.status_code, json.loads(response.content)
+
+    def earnings(self):
+        return dict(Courier.objects.values_list('courier_id', 'earnings'))
+
+    def test_batch_pays_every_order_once(self):
+        self.assertEqual(self.complete_batch((1, 1), (2, 4), (1, 2)),
+                         (200, {'orders': [{'order_id': 1}, {'order_id': 4}, {'order_id': 2}]}))
+        self.assertEqual(self.earnings(), {1: 2 * 1000, 2: 4500})
+        self.assertEqual(set(Order.objects.filter(done=True).values_list('order_id', flat=True)), {1, 2, 4})
+
+    def test_completed_order_is_accepted_again(self):
+        self.complete_batch((1, 1))
+        self.assertEqual(self.complete_batch((1, 1), (1, 3)), (200, {'orders': [{'order_id': 1}, {'order_id': 3}]}))
+        self.assertEqual(self.earnings(), {1: 2 * 1000, 2: 0})
+        self.assertEqual(DeliveryStats.objects.get(courier_id=1, region=1).count, 2)
+
+    def test_wrong_courier_or_missing_order_rolls_back_batch(self):
+        for records, error in ((((1, 1), (1, 4)), [4, 'Order assigned to different courier']),
+                               (((1, 1), (1, 99)), [99, 'No such order'])):
+            with self.subTest(records=records):
+                self.assertEqual(self.complete_batch(*records),
+                                 (400, {'validation_error': {'orders': [{'id': error}]}}))
+                self.assertFalse(Order.objects.filter(done=True).exists())
+                self.assertEqual(self.earnings(), {1: 0, 2: 0})
+
+    def test_format_errors_of_every_record(self):
+        response = self.post(views.complete_orders_batch, {'data': [
+            {'courier_id': 1, 'order_id': 1},
+            {'courier_id': '1', 'order_id': 2, 'complete_time': '2021-01-10T10:33:01.42Z'},
+            {'courier_id': 1, 'order_id': 3, 'complete_time': 'yesterday'},
+        ]})
+        self.assertEqual((response.status_code, json.loads(response.content)), (400, {'validation_error': {'orders': [
+            {'id': [1, 'Record should have only courier_id, order_id and complete_time fields']},
+            {'id': [2, 'Ids of courier and order should be integers']},
+            {'id': [3, 'Complete time is not in a correct format']},
+        ]}}))
+        self.assertFalse(Order.objects.filter(done=True).exists())
+
+
+class RatingTests(TestCase):
+    def test_running_totals_match_sorted_walk(self):
+        rng = random.Random(0)
+        courier = Courier.objects.create(courier_id=1, courier_type='car', regions=[1, 2, 3],
+                                         working_hours=['00:00-23:59'])
+        OrderSerializer.bulk_create([Order(order_id=order_id, weight=1, region=order_id % 3 + 1,
+                                           delivery_hours=['00:00-23:59']) for order_id in range(1, 31)], 100)
+        views.validated_assign_couriers({'courier_id': 1})
+        assign_time = Order.objects.get(order_id=1).assign_time
+        pending = list(range(1, 31))
+        # Completions come in random order, so some of them are earlier than the latest known one of their region
+        rng.shuffle(pending)
+        with mock.patch.object(DeliveryStats, 'recount', autospec=True, side_effect=DeliveryStats.recount) as recount:
+            while len(pending) != 0:
+                group = pending[:rng.randint(1, 3)]
+                pending = pending[len(group):]
+                completions = {order_id: (1, assign_time + datetime.timedelta(minutes=rng.randint(1, 600)))
+                               for order_id in group}
+                self.assertEqual(views.validated_complete_batch(completions), [])
+                profile = json.loads(views.see_courier(1).content)
+                self.assertEqual(profile.get('rating'), sorted_walk_rating(courier), group)
+        self.assertGreater(recount.call_count, 0)
+
+
+class BatchAssignmentTests(TestCase):
+    def test_batch_is_the_same_as_sequential_calls(self):
+        for weights in ('uniform', 'heavy', 'light'):
+            generator = DataGenerator(1000, seed=3, regions=5, weights=weights)
+            generator.create(40, 600)
+            courier_ids = list(generator.ids(40))
+            with self.subTest(weights=weights), transaction.atomic():
+                with transaction.atomic():
+                    single = [views.validated_assign_couriers({'courier_id': courier_id})[0]['orders']
+                              for courier_id in courier_ids]
+                    transaction.set_rollback(True)
+                batch, _ = views.validated_assign_batch(courier_ids)
+                self.assertGreater(sum(map(len, single)), 0)
+                self.assertEqual([[order['id'] for order in orders] for orders in single], batch)
+                transaction.set_rollback(True)
+            generator.delete(40, 600)
+
+
+@override_settings(DISPATCHER=True)
+class DispatchTests(TestCase):
+    def setUp(self):
+        self.courier = Courier.objects.create(courier_id=1, courier_type='foot', regions=[1],
+                                              working_hours=['09:00-18:00'])
+        OrderSerializer.bulk_create([Order(order_id=1, weight=5, region=1, delivery_hours=['10:00-11:00'])], 100)
+        # Dispatcher took the job of the upload
+        DispatchJob.objects.all().delete()
+
+    def test_offer_is_claimed(self):
+        Offer.objects.create(courier=self.courier, order_ids=[1], space=1000)
+        self.assertEqual([order.order_id for order in dispatch.claim_offer(self.courier, 1000)], [1])
+        self.assertFalse(Offer.objects.exists())
+
+    def test_offer_is_stale_while_job_waits(self):
+        # Order 2 comes while dispatcher packs the offer, so the upload can't drop the offer that is not committed yet
+        OrderSerializer.bulk_create([Order(order_id=2, weight=5, region=1, delivery_hours=['10:00-11:00'])], 100)
+        Offer.objects.create(courier=self.courier, order_ids=[1], space=1000)
+        self.assertIsNone(dispatch.claim_offer(self.courier, 1000))
+        answer, _ = views.validated_assign_couriers({'courier_id': 1})
+        self.assertEqual(answer['orders'], [{'id': 1}, {'id': 2}])
+
+
+@override_settings(ORDER_INDEX=True)
+class OrderIndexTests(TransactionTestCase):
+    def tearDown(self):
+        order_index.stop()
+
+    def wait(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def candidates(self):
+        return order_index.get().candidates([1], ['09:00-18:00'], 1000)
+
+    def test_changes_of_other_processes_come_with_notifications(self):
+        self.wait(lambda: order_index.get() is not None)
+        # Changes of this process are not applied directly, like changes of another process
+        with mock.patch.object(order_index, 'apply'):
+            OrderSerializer.bulk_create([Order(order_id=order_id, weight=1, region=1, delivery_hours=['10:00-11:00'])
+                                         for order_id in range(1, 2001)], 1000)
+            self.wait(lambda: len(self.candidates()) == 2000)
+            Order.objects.filter(order_id__lte=1500).update(done=True)
+            order_index.orders_removed(range(1, 1501))
+            self.wait(lambda: len(self.candidates()) == 500)
+
+
+class FastValidationTests(TestCase):
+    couriers = [
+        {'courier_id': 1, 'courier_type': 'foot', 'regions': [1, 2], 'working_hours': ['09:00-18:00']},
+        {'courier_id': 2, 'courier_type': 'car', 'regions': [], 'working_hours': []},
+        {'courier_id': 3, 'courier_type': 'bike', 'regions': [3], 'working_hours': ['23:00-01:00', '10:00-11:00']},
+    ]
+    orders = [
+        {'order_id': 1, 'weight': 0.01, 'region': 1, 'delivery_hours': ['09:00-18:00']},
+        {'order_id': 2, 'weight': 50, 'region': 2, 'delivery_hours': ['22:00-02:00']},
+        {'order_id': 3, 'weight': 12.34, 'region': 3, 'delivery_hours': ['10:00-11:00', '12:00-13:00']},
+    ]
+    invalid_couriers = [
+        {'courier_id': 10, 'courier_type': 'plane', 'regions': [1], 'working_hours': []},
+        {'courier_id': 11, 'courier_type': 'foot', 'regions': [0], 'working_hours': []},
+        {'courier_id': 12, 'courier_type': 'foot', 'regions': [1], 'working_hours': ['9:00-18:00']},
+        {'courier_id': 13, 'courier_type': 'foot', 'regions': [1]},
+        {'courier_id': 14, 'courier_type': 'foot', 'regions': [1], 'working_hours': [], 'rating': 5},
+        {'courier_id': 14, 'courier_type': 'foot', 'regions': [1], 'working_hours': []},
+        {'courier_id': 100, 'courier_type': 'foot', 'regions': [1], 'working_hours': []},
+    ]
+    invalid_orders = [
+        {'order_id': 10, 'weight': 0, 'region': 1, 'delivery_hours': ['09:00-18:00']},
+        {'order_id': 11, 'weight': 1.234, 'region': 1, 'delivery_hours': ['09:00-18:00']},
+        {'order_id': 12, 'weight': 1, 'region': 0, 'delivery_hours': ['09:00-18:00']},
+        {'order_id': 13, 'weight': 1, 'region': 1, 'delivery_hours': ['09:00-24:00']},
+        {'order_id': 14, 'weight': 1, 'region': 1},
+        {'order_id': 14, 'weight': 1, 'region': 1, 'delivery_hours': ['09:00-18:00']},
+        {'order_id': 100, 'weight': 1, 'region': 1, 'delivery_hours': ['09:00-18:00']},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        # Taken ids make uniqueness validators of serializers report errors
+        Courier.objects.create(courier_id=100, courier_type='foot', regions=[1], working_hours=[])
+        Order.objects.create(order_id=100, weight=1, region=1, delivery_hours=['09:00-18:00'])
+
+    def test_fast_data_is_validated_data_of_serializer(self):
+        for serializer_class, fast_data, items in ((CourierSerializer, validators.courier_data, self.couriers),
+                                                   (OrderSerializer, validators.order_data, self.orders)):
+            for item in items:
+                with self.subTest(item=item):
+                    serializer = serializer_class(data=item)
+                    serializer.is_valid()
+                    self.assertEqual(fast_data(item), dict(serializer.validated_data))
+
+    def test_invalid_items_are_left_to_serializer(self):
+        for item in self.invalid_couriers:
+            self.assertTrue(validators.courier_data(item) is None or item['courier_id'] in (14, 100), item)
+        for item in self.invalid_orders:
+            self.assertTrue(validators.order_data(item) is None or item['order_id'] in (14, 100), item)
+
+    def upload(self, view, data):
+        request = RequestFactory().post('/', json.dumps({'data': data}), content_type='application/json')
+        response = view(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_errors_are_the_same_as_without_fast_path(self):
+        for view, serializer_class, items in (
+                (views.upload_couriers, CourierSerializer, self.couriers + self.invalid_couriers),
+                (views.upload_orders, OrderSerializer, self.orders + self.invalid_orders)):
+            with self.subTest(view=view.__name__):
+                fast = self.upload(view, items)
+                with mock.patch.object(serializer_class, 'fast_validated_data', return_value=None):
+                    slow = self.upload(view, items)
+                self.assertEqual(fast[0], 400)
+                self.assertEqual(fast, slow)
+
+    def test_valid_upload_is_the_same_as_without_fast_path(self):
+        fast = self.upload(views.upload_orders, self.orders)
+        created = list(Order.objects.filter(order_id__in=[1, 2, 3]).order_by('order_id').values())
+        Order.objects.filter(order_id__in=[1, 2, 3]).delete()
+        with mock.patch.object(OrderSerializer, 'fast_validated_data', return_value=None):
+            slow = self.upload(views.upload_orders, self.orders)
+        self.assertEqual(fast, slow)
+        self.assertEqual(created, list(Order.objects.filter(order_id__in=[1, 2, 3]).order_by('order_id').values()))
+
+
+class IndexUsageTests(TestCase):
+    """
+    Hot queries of the API read orders by index on a table large enough for the planner to prefer it
+    """
+    first_id = 3000000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.regions = list(range(cls.first_id, cls.first_id + 50))
+        courier_ids = list(range(cls.first_id, cls.first_id + 100))
+        Courier.objects.bulk_create(
+            Courier(courier_id=courier_id, courier_type='car', regions=cls.regions[courier_id % 50:][:3],
+                    working_hours=['09:00-18:00']) for courier_id in courier_ids)
+        orders = []
+        for order_id in range(cls.first_id, cls.first_id + 50000):
+            order = Order(order_id=order_id, weight=round(0.01 + order_id % 500 / 10, 2),
+                          region=cls.regions[order_id % 50], delivery_hours=['10:00-12:00', '16:00-20:00'])
+            if order_id % 3 != 0:
+                order.assigned_to_id = courier_ids[order_id % 100]
+                order.assign_time = now
+            if order_id % 3 == 1:
+                order.done = True
+                order.complete_time = now + datetime.timedelta(minutes=order_id % 90)
+            orders.append(order)
+        OrderSerializer.bulk_create(orders, 1000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE "API_order"')
+            cursor.execute('ANALYZE "API_deliverywindow"')
+
+    def test_queries_use_indexes(self):
+        courier = Courier.objects.get(courier_id=self.first_id)
+        queries = {
+            'candidate orders': views.candidate_orders(courier, 5000),
+            'release on courier change': Order.objects.filter(done=False, assigned_to=courier).order_by('weight'),
+            'rating recount': Order.objects.filter(assigned_to=courier, region=self.regions[0], done=True).order_by(
+                'complete_time'),
+            'courier profile': DeliveryStats.objects.filter(courier=courier, region__in=courier.regions, count__gt=0),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertNotIn('Seq Scan on "API_order"', plan)
+                self.assertIn('Index', plan)
+
+
+class ListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Courier.objects.bulk_create(
+            Courier(courier_id=courier_id, courier_type=('foot', 'car')[courier_id % 2], regions=[courier_id % 2 + 1],
+                    working_hours=['09:00-18:00']) for courier_id in range(1, 8))
+        OrderSerializer.bulk_create([Order(order_id=order_id, weight=1, region=order_id % 2 + 1,
+                                           delivery_hours=['10:00-11:00'], done=order_id % 3 == 0)
+                                     for order_id in range(1, 11)], 100)
+
+    def get(self, view, params, **headers):
+        return view(RequestFactory().get('/', params, **headers))
+
+    def pages(self, view, params):
+        ids = []
+        after = None
+        while True:
+            response = self.get(view, dict(params, limit=3, **({'after': after} if after is not None else {})))
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.content)
+            ids.append([row['courier_id' if view is views.upload_couriers else 'order_id'] for row in page['data']])
+            after = page['next']
+            if after is None:
+                return ids
+
+    def test_pages_follow_next(self):
+        self.assertEqual(self.pages(views.upload_couriers, {}), [[1, 2, 3], [4, 5, 6], [7]])
+        self.assertEqual(self.pages(views.upload_orders, {}), [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10]])
+
+    def test_filters(self):
+        self.assertEqual(self.pages(views.upload_couriers, {'region': 2}), [[1, 3, 5], [7]])
+        self.assertEqual(self.pages(views.upload_couriers, {'courier_type': 'foot'}), [[2, 4, 6]])
+        self.assertEqual(self.pages(views.upload_orders, {'region': 1, 'done': 'false'}), [[2, 4, 8], [10]])
+        self.assertEqual(self.pages(views.upload_orders, {'assigned_to': 'none', 'done': 'true'}), [[3, 6, 9]])
+        for params in ({'weight': 1}, {'done': 'yes'}, {'limit': 0}, {'after': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(views.upload_orders, params).status_code, 400)
+
+    def test_ndjson_export_has_rows_of_pages(self):
+        page = json.loads(self.get(views.upload_orders, {'after': 2, 'done': 'false'}).content)
+        for params, headers in (({'after': 2, 'done': 'false'}, {'HTTP_ACCEPT': 'application/x-ndjson'}),
+                                ({'after': 2, 'done': 'false', 'stream': 1}, {})):
+            with self.subTest(params=params):
+                response = self.get(views.upload_orders, params, **headers)
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+                content = b''.join(response.streaming_content).decode()
+                self.assertEqual([json.loads(line) for line in content.splitlines()], page['data'])
+
+
+@override_settings(SHARED_CACHE=True, IDEMPOTENCY_WAIT=0)
+class IdempotencyTests(TestCase):
+    courier = {'courier_id': 1, 'courier_type': 'foot', 'regions': [1], 'working_hours': ['09:00-18:00']}
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, view, data, key='upload-1'):
+        request = RequestFactory().post('/couriers', json.dumps({'data': data}), content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY=key)
+        return view(request)
+
+    def test_repeated_request_gets_the_first_response(self):
+        first = self.post(views.upload_couriers, [self.courier])
+        second = self.post(views.upload_couriers, [self.courier])
+        self.assertEqual((first.status_code, first.content), (201, b'{"couriers": [{"id": 1}]}'))
+        self.assertEqual((second.status_code, second.content), (first.status_code, first.content))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        # Without the key the same body is a conflict with the courier created by the first request
+        self.assertEqual(self.post(views.upload_couriers, [self.courier], key='upload-2').status_code, 400)
+
+    def test_key_of_another_request_is_rejected(self):
+        self.post(views.upload_couriers, [self.courier])
+        response = self.post(views.upload_couriers, [dict(self.courier, courier_id=2)])
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Courier.objects.filter(courier_id=2).exists())
+
+    def test_request_in_progress_is_a_conflict(self):
+        answers = []
+
+        @idempotency.idempotent
+        def view(request):
+            answers.append(self.post(view, [self.courier]))
+            return JsonResponse({'couriers': [{'id': 1}]}, status=201)
+
+        self.assertEqual(self.post(view, [self.courier]).status_code, 201)
+        self.assertEqual([response.status_code for response in answers], [409])
+        # The lock is given back when the first request is done
+        self.assertEqual(self.post(view, [self.courier])['Idempotent-Replayed'], 'true')
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0.3)
+    def test_lock_is_prolonged_while_request_runs(self):
+        lock_key = idempotency.lock_key(hashlib.sha256(b'/couriers:upload-1').hexdigest())
+        held = []
+
+        @idempotency.idempotent
+        def view(request):
+            time.sleep(1)
+            held.append(cache.get(lock_key))
+            return JsonResponse({}, status=201)
+
+        self.post(view, [self.courier])
+        self.assertIsNotNone(held[0])
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_lock_of_another_request_is_not_released(self):
+        lock_key = idempotency.lock_key(hashlib.sha256(b'/couriers:upload-1').hexdigest())
+
+        @idempotency.idempotent
+        def view(request):
+            # The lock expired and a retry took it while this request was still running
+            cache.set(lock_key, 'retry')
+            return JsonResponse({}, status=201)
+
+        self.post(view, [self.courier])
+        self.assertEqual(cache.get(lock_key), 'retry')
+
+
+@override_settings(SHARED_CACHE=True)
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Courier.objects.create(courier_id=1, courier_type='foot', regions=[1], working_hours=['09:00-18:00'])
+
+    def get(self, **headers):
+        return views.update_couriers(RequestFactory().get('/couriers/1', **headers), 1)
+
+    def test_unchanged_profile_is_not_modified(self):
+        first = self.get()
+        self.assertEqual((first.status_code, first['X-Cache']), (200, 'MISS'))
+        self.assertEqual(json.loads(first.content)['courier_id'], 1)
+        second = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((second.status_code, second['X-Cache'], second.content), (304, 'HIT', b''))
+        self.assertEqual(second['ETag'], first['ETag'])
+        third = self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(third.status_code, 304)
+
+    def test_change_gives_new_etag(self):
+        first = self.get()
+        with mock.patch('API.cache.transaction.on_commit', lambda callback: callback()):
+            request = RequestFactory().patch('/couriers/1', json.dumps({'working_hours': ['10:00-12:00']}),
+                                             content_type='application/json')
+            self.assertEqual(views.update_couriers(request, 1).status_code, 200)
+        second = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((second.status_code, second['X-Cache']), (200, 'MISS'))
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(json.loads(second.content)['working_hours'], ['10:00-12:00'])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_etag_without_shared_cache(self):
+        first = self.get()
+        self.assertEqual(first['X-Cache'], 'BYPASS')
+        self.assertFalse(first.has_header('Last-Modified'))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
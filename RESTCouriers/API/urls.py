@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Under ASGI the same endpoints are served by async views
+api = async_views if settings.ASYNC_API else views
 
 urlpatterns = [
-    path('couriers', views.upload_couriers),
-    path('couriers/<int:courier_id>', views.update_couriers),
-    path('orders', views.upload_orders),
-    path('orders/assign', views.assign_orders),
-    path('orders/complete', views.complete_order),
-]
\ No newline at end of file
+    path('couriers', api.upload_couriers),
+    path('couriers/<int:courier_id>', api.update_couriers),
+    path('orders', api.upload_orders),
+    path('orders/assign', api.assign_orders),
+    path('orders/assign/batch', api.assign_orders_batch),
+    path('orders/complete', api.complete_order),
+    path('orders/complete/batch', api.complete_orders_batch),
+]
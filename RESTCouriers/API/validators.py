@@ -0,0 +1,67 @@
+"""
+Fast checks of uploaded couriers and orders.
+
+Item that passes a check is valid for its serializer too and gets the same validated data. Anything suspicious gets
+None and is validated by the serializer, so errors are exactly the ones serializers report.
+"""
+import math
+import re
+
+MAX_INT = 2147483647
+TIME_GAP = re.compile(r'(?:[01][0-9]|2[0-3]):[0-5][0-9]-(?:[01][0-9]|2[0-3]):[0-5][0-9]\Z')
+COURIER_FIELDS = {'courier_id', 'courier_type', 'regions', 'working_hours'}
+ORDER_FIELDS = {'order_id', 'weight', 'region', 'delivery_hours'}
+COURIER_TYPES = ('foot', 'bike', 'car')
+
+
+def is_positive_int(value):
+    # bool is int too but serializers treat it differently
+    return type(value) is int and 0 < value <= MAX_INT
+
+
+def are_time_gaps(gaps):
+    return type(gaps) is list and all(type(gap) is str and TIME_GAP.match(gap) for gap in gaps)
+
+
+def courier_data(item):
+    """
+    Validated data of courier or None if serializer has to decide
+    """
+    if type(item) is not dict or item.keys() != COURIER_FIELDS:
+        return None
+    if not is_positive_int(item['courier_id']) or item['courier_type'] not in COURIER_TYPES:
+        return None
+    if type(item['regions']) is not list or not all(is_positive_int(region) for region in item['regions']):
+        return None
+    if not are_time_gaps(item['working_hours']):
+        return None
+    return {
+        'courier_id': item['courier_id'],
+        'courier_type': item['courier_type'],
+        'regions': item['regions'],
+        'working_hours': item['working_hours']
+    }
+
+
+def order_data(item):
+    """
+    Validated data of order or None if serializer has to decide
+    """
+    if type(item) is not dict or item.keys() != ORDER_FIELDS:
+        return None
+    if not is_positive_int(item['order_id']) or not is_positive_int(item['region']):
+        return None
+    if type(item['weight']) not in (int, float):
+        return None
+    weight = float(item['weight'])
+    # Weight is stored as float, so it has at most two digits after point if its shortest repr has them
+    if not (math.isfinite(weight) and 0.01 <= weight <= 50) or len(repr(weight).partition('.')[2]) > 2:
+        return None
+    if not are_time_gaps(item['delivery_hours']) or len(item['delivery_hours']) == 0:
+        return None
+    return {
+        'order_id': item['order_id'],
+        'weight': weight,
+        'region': item['region'],
+        'delivery_hours': item['delivery_hours']
+    }
@@ -1,48 +1,182 @@
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound
+from array import array
+from heapq import merge
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Exists, F, IntegerField, OuterRef, Value, When
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotFound, StreamingHttpResponse
 from rest_framework.parsers import JSONParser, ParseError
 from .serializers import CourierSerializer, OrderSerializer
-from .models import Courier, Order
+from . import allocation, cache, dispatch, intervals, metrics, order_index, streaming
+from .idempotency import idempotent
+from .models import Courier, Order, AssignmentBatch, DeliveryWindow, DeliveryStats, CAPACITIES, earning, hundredths
 from rest_framework.exceptions import ValidationError
 from django.utils import timezone
 from dateutil.parser import isoparse
 from dateutil.tz import UTC
 
+# Fields of rows of GET /couriers and GET /orders
+LIST_FIELDS = {
+    Courier: ['courier_id', 'courier_type', 'regions', 'working_hours', 'earnings'],
+    Order: ['order_id', 'weight', 'region', 'delivery_hours', 'done', 'assigned_to', 'assign_time', 'complete_time'],
+}
+LIST_PARAMETERS = ('after', 'limit', 'stream')
 
+
+@idempotent
 def upload_couriers(request):
     """
-    Creates and saves couriers
+    Creates and saves couriers, GET lists them
     """
+    if request.method == 'GET':
+        try:
+            conditions = courier_filters(request.GET)
+        except ValueError:
+            return HttpResponseBadRequest('Filters should be region, courier_type, after and limit')
+        return list_rows(request, Courier, conditions)
+    if request.method == 'POST' and streaming.is_streamed(request):
+        return bulk_upload(streamed_items(request), CourierSerializer, 'couriers', 'courier_id', streamed=True)
     if request.method == 'POST' and request.body is not None:
         try:
             json = JSONParser().parse(request)
         except ParseError:
             return JsonResponse({'validation_error': 'Impossible to parse to JSON'}, status=400)
-        valid = True
-        error_list = {'couriers': []}
-        created_list = {'couriers': []}
-        for courier in json['data']:
-            serializer = CourierSerializer(data=courier)
-            try:
-                serializer.is_valid()
-                serializer.save()
-                created_list['couriers'].append({'id': courier['courier_id']})
-            except ValidationError as error:
-                valid = False
-                error_list['couriers'].append(
-                    {'id': ['' if courier.get('courier_id') is None else courier['courier_id'], error.detail]})
-        if valid:
-            return JsonResponse(created_list, status=201)
-        else:
-            return JsonResponse({'validation_error': error_list}, status=400)
+        return bulk_upload(json['data'], CourierSerializer, 'couriers', 'courier_id')
     return JsonResponse({'request_error': 'should be POST request with body'}, status=400)
 
 
+def courier_filters(params):
+    conditions = {}
+    for name in params:
+        if name == 'region':
+            conditions['regions__contains'] = [int(params[name])]
+        elif name == 'courier_type':
+            conditions['courier_type'] = params[name]
+        elif name not in LIST_PARAMETERS:
+            raise ValueError(name)
+    return conditions
+
+
+def order_filters(params):
+    conditions = {}
+    for name in params:
+        if name == 'region':
+            conditions['region'] = int(params[name])
+        elif name == 'done':
+            if params[name] not in ('true', 'false'):
+                raise ValueError(name)
+            conditions['done'] = params[name] == 'true'
+        elif name == 'assigned_to':
+            if params[name] == 'none':
+                conditions['assigned_to__isnull'] = True
+            else:
+                conditions['assigned_to'] = int(params[name])
+        elif name not in LIST_PARAMETERS:
+            raise ValueError(name)
+    return conditions
+
+
+def list_rows(request, model, conditions):
+    """
+    Rows of model after the given primary key in order of it. JSON page has at most limit rows and the key to ask
+    the next page after, NDJSON export has all the rows and reads them with server side cursor
+    """
+    key = model._meta.pk.name
+    try:
+        after = int(request.GET['after']) if 'after' in request.GET else None
+        limit = int(request.GET['limit']) if 'limit' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest('after and limit should be integers')
+    if limit is not None and not 0 < limit <= settings.LIST_MAX_LIMIT:
+        return HttpResponseBadRequest('limit should be from 1 to {0}'.format(settings.LIST_MAX_LIMIT))
+    rows = model.objects.filter(**conditions).order_by(key).values(*LIST_FIELDS[model])
+    if after is not None:
+        rows = rows.filter(pk__gt=after)
+    if 'application/x-ndjson' in request.headers.get('Accept', '') or request.GET.get('stream') == '1':
+        if limit is not None:
+            rows = rows[:limit]
+        return StreamingHttpResponse(streaming.ndjson_content(rows.iterator(chunk_size=settings.LIST_CHUNK_SIZE)),
+                                     content_type='application/x-ndjson')
+    limit = limit or settings.LIST_LIMIT
+    page = list(rows[:limit + 1])
+    return JsonResponse({'data': page[:limit], 'next': page[limit - 1][key] if len(page) > limit else None})
+
+
+def streamed_items(request):
+    if request.content_type == 'application/x-ndjson':
+        return streaming.iter_ndjson_items(request)
+    return streaming.iter_json_items(request, 'data')
+
+
+def bulk_upload(data, serializer_class, key, id_field, streamed=False):
+    """
+    Validates items of data and writes them with bulk_create in chunks of UPLOAD_BATCH_SIZE inside one transaction,
+    so either all items are created or none of them. Items are kept in memory only for the current chunk, but memory
+    still grows with the body: ids of created items are kept for the response, 8 bytes each, and after the first
+    error ids of all items are kept to report duplicates along with the errors themselves
+    """
+    model = serializer_class.Meta.model
+    duplicate_message = model._meta.get_field(id_field).error_messages['unique'] % {
+        'model_name': model._meta.verbose_name,
+        'field_label': model._meta.get_field(id_field).verbose_name
+    }
+    valid = True
+    error_list = {key: []}
+    created_ids = array('q')
+    # Ids of items that are not written yet, so uniqueness validator can't see them
+    pending_ids = set()
+    items = iter(data)
+    try:
+        with transaction.atomic():
+            while True:
+                batch = list(islice(items, settings.UPLOAD_BATCH_SIZE))
+                if len(batch) == 0:
+                    break
+                # Items passing fast check skip the serializer unless their id is already taken
+                fast_data = [serializer_class.fast_validated_data(item) for item in batch]
+                taken_ids = set(model.objects.filter(
+                    pk__in=[item[id_field] for item, validated in zip(batch, fast_data) if validated is not None]
+                ).values_list('pk', flat=True))
+                chunk = []
+                for item, validated_data in zip(batch, fast_data):
+                    try:
+                        if validated_data is None or item[id_field] in taken_ids:
+                            serializer = serializer_class(data=item)
+                            serializer.is_valid()
+                            validated_data = serializer.validated_data
+                        if item[id_field] in pending_ids:
+                            raise ValidationError({id_field: [duplicate_message]})
+                        pending_ids.add(item[id_field])
+                        created_ids.append(validated_data[id_field])
+                        chunk.append(model(**validated_data))
+                    except ValidationError as error:
+                        valid = False
+                        error_list[key].append(
+                            {'id': ['' if item.get(id_field) is None else item[id_field], error.detail]})
+                # After the first error nothing is written any more but the rest is still validated to report it
+                if valid:
+                    serializer_class.bulk_create(chunk, settings.UPLOAD_BATCH_SIZE)
+                    if model is Order:
+                        metrics.count_orders('uploaded', len(chunk))
+                    pending_ids.clear()
+            if not valid:
+                transaction.set_rollback(True)
+    except ParseError:
+        return JsonResponse({'validation_error': 'Impossible to parse to JSON'}, status=400)
+    if not valid:
+        return JsonResponse({'validation_error': error_list}, status=400)
+    if streamed:
+        return StreamingHttpResponse(streaming.created_content(key, created_ids), status=201,
+                                     content_type='application/json')
+    return JsonResponse({key: [{'id': item_id} for item_id in created_ids]}, status=201)
+
+
 def update_couriers(request, courier_id):
     """
     Update info about couriers
     """
     if request.method == 'GET':
-        return see_courier(courier_id)
+        return cache.cached_profile(request, courier_id, see_courier)
     if request.method == 'PATCH' and request.body is not None:
         try:
             json = JSONParser().parse(request)
@@ -61,35 +195,29 @@ def update_couriers(request, courier_id):
     return HttpResponseBadRequest('Request method should be patch and request should have body')
 
 
+@idempotent
 def upload_orders(request):
     """
-    Creates and saves orders
+    Creates and saves orders, GET lists them
     """
+    if request.method == 'GET':
+        try:
+            conditions = order_filters(request.GET)
+        except ValueError:
+            return HttpResponseBadRequest('Filters should be region, done, assigned_to, after and limit')
+        return list_rows(request, Order, conditions)
+    if request.method == 'POST' and streaming.is_streamed(request):
+        return bulk_upload(streamed_items(request), OrderSerializer, 'orders', 'order_id', streamed=True)
     if request.method == 'POST' and request.body is not None:
         try:
             json = JSONParser().parse(request)
         except ParseError:
             return JsonResponse({'validation_error': 'Impossible to parse to JSON'}, status=400)
-        valid = True
-        error_list = {'orders': []}
-        created_list = {'orders': []}
-        for order in json['data']:
-            serializer = OrderSerializer(data=order)
-            try:
-                serializer.is_valid()
-                serializer.save()
-                created_list['orders'].append({'id': order['order_id']})
-            except ValidationError as error:
-                valid = False
-                error_list['orders'].append(
-                    {'id': ['' if order.get('order_id') is None else order['order_id'], error.detail]})
-        if valid:
-            return JsonResponse(created_list, status=201)
-        else:
-            return JsonResponse({'validation_error': error_list}, status=400)
+        return bulk_upload(json['data'], OrderSerializer, 'orders', 'order_id')
     return JsonResponse({'request_error': 'should be POST request with body'}, status=400)
 
 
+@idempotent
 def assign_orders(request):
     """
     Assigning orders so sum of weights of orders is not greater than carrying capacity of courier
@@ -113,83 +241,192 @@ def validated_assign_couriers(json):
     """
     Method to assign orders to couriers using only json that contains order_id
     """
-    courier = Courier.objects.filter(courier_id=json.get('courier_id'))[0]
-    orders = Order.objects.filter(done=False).filter(region__in=courier.regions).order_by('-weight')
-    # We ordering by -weight cause we want to pack from max weight cause in other case foot couriers will not have
-    # any light orders all of them will be delivered by high carrying capacity couriers
-    suitable_orders = []
-    for order in orders:
-        if any(CourierSerializer.hours_intersect(delivery_gap, courier.working_hours) for delivery_gap in
-               order.delivery_hours):
-            suitable_orders.append(order)
-    current_payload = sum(order.weight for order in Order.objects.filter(assigned_to=courier).filter(done=False))
+    with transaction.atomic():
+        # Courier is locked so concurrent calls for one courier can't both count the same free space,
+        # chosen orders are locked so couriers of the same region never get the same order
+        courier = Courier.objects.select_for_update().get(courier_id=json.get('courier_id'))
+        batch = AssignmentBatch.open_batches([courier.courier_id]).get(courier.courier_id)
+        space = AssignmentBatch.space(courier, batch)
+        answer = {
+            'orders': [],
+            'assign_time': ''
+        }
+        now = timezone.now()
+        if courier.courier_type in CAPACITIES:
+            offered = dispatch.claim_offer(courier, space) if dispatch.enabled() else None
+            orders = offered if offered is not None else planned_orders(courier, space)
+            order_ids = [order.order_id for order in orders]
+            if len(order_ids) != 0:
+                batch = AssignmentBatch.add(courier, batch, orders, now)
+                Order.objects.filter(order_id__in=order_ids).update(assigned_to=courier, assign_time=now, batch=batch)
+                order_index.orders_removed(order_ids)
+            # Offer is used up or stale, the next call gets a fresh one. Empty valid offer is still good
+            if offered is None or len(order_ids) != 0:
+                dispatch.enqueue([courier.courier_id])
+            metrics.count_orders('assigned', len(order_ids))
+            answer['orders'] = [{'id': order_id} for order_id in order_ids]
+            cache.invalidate(courier.courier_id)
+    return answer, now.isoformat()
+
+
+def planned_orders(courier, space):
+    """
+    Orders packed for courier with space hundredths of kilogram, they stay locked till the end of transaction
+    """
+    return locked_packing(courier, space, candidates(courier, space))
+
+
+def candidates(courier, space):
+    indexed = indexed_candidate_orders(courier, space) if order_index.enabled() else None
+    return indexed if indexed is not None else list(candidate_orders(courier, space))
+
+
+def packing(courier, space, items):
+    """
+    Orders of items chosen for courier with space hundredths of kilogram
+    """
     # Here we should pack backpack like in knapsack problem
-    answer = {
-        'orders': [],
-        'assign_time': ''
-    }
-    timestamp = timezone.now().isoformat()
-    items = []
-    for order in suitable_orders:
-        order.weight = int(order.weight * 100)
-        items.append(order)
-    if courier.courier_type == 'foot':
-        suitable = knapsack(10 * 100 - int(current_payload * 100), items)
-        for order in suitable:
-            if order.assigned_to is None:
-                order.weight = round(order.weight / 100, 2)
-                order.assign_time = timestamp
-                order.assigned_to = courier
-                order.save()
-                answer['orders'].append({'id': order.order_id})
-    elif courier.courier_type == 'bike':
-        suitable = knapsack(15 * 100 - int(current_payload * 100), items)
-        for order in suitable:
-            if order.assigned_to is None:
-                order.weight = round(order.weight / 100, 2)
-                order.assign_time = timestamp
-                order.assigned_to = courier
-                order.save()
-                answer['orders'].append({'id': order.order_id})
-    elif courier.courier_type == 'car':
-        suitable = knapsack(50 * 100 - int(current_payload * 100), items)
-        for order in suitable:
-            if order.assigned_to is None:
-                order.weight = round(order.weight / 100, 2)
-                order.assign_time = timestamp
-                order.assigned_to = courier
-                order.save()
-                answer['orders'].append({'id': order.order_id})
-    return answer, timestamp
-
-
-def knapsack(space, items):
-    """
-    Probably we could scale algo to work with float by multiplication by 100 every number.
-    """
-    w = [item.weight for item in items]
-    matrix = [[0 for _ in range(space + 1)] for _ in range(len(w) + 1)]
-    for k in range(len(items) + 1):
-        for s in range(space + 1):
-            if k == 0 or s == 0:
-                matrix[k][s] = 0
-            elif s >= w[k - 1]:
-                matrix[k][s] = max(matrix[k - 1][s], matrix[k - 1][s - w[k - 1]] + w[k - 1])
-            else:
-                matrix[k][s] = matrix[k - 1][s]
-    take_orders = []
+    weights = [hundredths(order.weight) for order in items]
+    chosen = allocation.solve(courier.courier_type, space, weights, packing_scope(courier),
+                              [(order.order_id, weight) for order, weight in zip(items, weights)])
+    return [items[index] for index in chosen]
+
+
+def locked_packing(courier, space, items):
+    """
+    Packs items and locks only the chosen orders. Orders that other transactions locked or took meanwhile are dropped
+    and the rest is packed again, so concurrent couriers of a region get different orders instead of empty answers
+    """
+    while True:
+        chosen = packing(courier, space, items)
+        order_ids = [order.order_id for order in chosen]
+        locked = set(Order.objects.filter(order_id__in=order_ids, done=False, assigned_to__isnull=True)
+                     .select_for_update(skip_locked=True).values_list('order_id', flat=True))
+        if len(locked) == len(order_ids):
+            return chosen
+        taken = set(order_ids) - locked
+        items = [order for order in items if order.order_id not in taken]
+
+
+def packing_scope(courier):
+    """
+    Couriers with the same regions and working hours get the same candidates, so packing of one reuses the other's
+    """
+    return tuple(sorted(set(courier.regions))), intervals.hours(courier.working_hours)
+
 
-    def find_orders(absciss, ordin):
-        if matrix[absciss][ordin] == 0:
-            return
-        if matrix[absciss - 1][ordin] == matrix[absciss][ordin]:
-            find_orders(absciss - 1, ordin)
-        else:
-            find_orders(absciss - 1, ordin - w[absciss - 1])
-            take_orders.append(items[absciss - 1])
+@idempotent
+def assign_orders_batch(request):
+    """
+    Assigning orders to many couriers at once, couriers are served in the given order so the result is the same as
+    of sequential calls of assign_orders for each of them
+    """
+    if request.method == 'POST' and request.body is not None:
+        try:
+            json = JSONParser().parse(request)
+        except ParseError:
+            return JsonResponse({'validation_error': 'Impossible to parse to JSON'}, status=400)
+        courier_ids = json.get('courier_ids') if isinstance(json, dict) else None
+        if not isinstance(json, dict) or list(json.keys()) != ['courier_ids'] or \
+                not isinstance(courier_ids, list) or len(courier_ids) == 0 or \
+                not all(type(courier_id) is int for courier_id in courier_ids) or \
+                len(set(courier_ids)) != len(courier_ids) or \
+                Courier.objects.filter(courier_id__in=courier_ids).count() != len(courier_ids):
+            return HttpResponseBadRequest('Json should have only courier_ids field with list of different ids of '
+                                          'existing couriers')
+        answers, timestamp = validated_assign_batch(courier_ids)
+        couriers = []
+        for courier_id, order_ids in zip(courier_ids, answers):
+            answer = {'courier_id': courier_id, 'orders': [{'id': order_id} for order_id in order_ids]}
+            if len(order_ids) != 0:
+                answer['assign_time'] = timestamp
+            couriers.append(answer)
+        return JsonResponse({'couriers': couriers}, status=200)
+    return HttpResponseBadRequest('should be POST request with body')
 
-    find_orders(len(items), space)
-    return take_orders
+
+def validated_assign_batch(courier_ids):
+    """
+    Loads the backlog of all regions of couriers once and packs couriers one after another from it
+    """
+    with transaction.atomic():
+        # Couriers are locked in order of ids so concurrent batches can't deadlock on them
+        couriers = {courier.courier_id: courier for courier in
+                    Courier.objects.select_for_update().filter(courier_id__in=courier_ids).order_by('courier_id')}
+        batches = AssignmentBatch.open_batches(courier_ids)
+        regions = set(region for courier in couriers.values() for region in courier.regions)
+        # Backlog is read without locks, only orders chosen for couriers are locked
+        backlog = Order.objects.filter(done=False, assigned_to__isnull=True, region__in=regions).order_by(
+            '-weight', 'order_id')
+        by_region = {}
+        for order in backlog:
+            order.minutes = []
+            by_region.setdefault(order.region, {})[order.order_id] = order
+        for order_id, region, minutes in DeliveryWindow.objects.filter(
+                order__done=False, order__assigned_to__isnull=True, order__region__in=regions).values_list(
+                'order_id', 'order__region', 'minutes'):
+            if order_id in by_region.get(region, {}):
+                by_region[region][order_id].minutes.append(intervals.from_range(minutes))
+        for orders in by_region.values():
+            for order in orders.values():
+                order.minutes = intervals.normalize(order.minutes)
+        now = timezone.now()
+        answers = []
+        for courier_id in courier_ids:
+            courier = couriers[courier_id]
+            space = AssignmentBatch.space(courier, batches.get(courier_id))
+            working = intervals.hours(courier.working_hours)
+            # Regions are already sorted by weight so merging keeps the order single assignment uses
+            items = [order for order in merge(*(by_region.get(region, {}).values() for region in set(courier.regions)),
+                                              key=lambda order: (-order.weight, order.order_id))
+                     if order.weight < (space + 1) / 100 and intervals.intersects(order.minutes, working)]
+            order_ids = []
+            if courier.courier_type in CAPACITIES and space > 0:
+                chosen = locked_packing(courier, space, items)
+                order_ids = [order.order_id for order in chosen]
+                for order in chosen:
+                    del by_region[order.region][order.order_id]
+                if len(order_ids) != 0:
+                    batch = AssignmentBatch.add(courier, batches.get(courier_id), chosen, now)
+                    Order.objects.filter(order_id__in=order_ids).update(assigned_to=courier, assign_time=now,
+                                                                        batch=batch)
+                    order_index.orders_removed(order_ids)
+                metrics.count_orders('assigned', len(order_ids))
+                cache.invalidate(courier_id)
+            answers.append(order_ids)
+    return answers, now.isoformat()
+
+
+def candidate_orders(courier, space):
+    """
+    Orders that are not done, not assigned yet, lie in regions of courier, could be delivered in its working hours
+    and fit in space hundredths of kilogram
+    """
+    fits_hours = DeliveryWindow.overlap_q(courier.working_hours)
+    if len(fits_hours) == 0 or space <= 0:
+        return Order.objects.none()
+    windows = DeliveryWindow.objects.filter(order=OuterRef('pk')).filter(fits_hours)
+    # We ordering by -weight cause we want to pack from max weight cause in other case foot couriers will not have
+    # any light orders all of them will be delivered by high carrying capacity couriers. Ties go by id so the same
+    # backlog always comes in the same order and packing can reuse rows of the previous call.
+    # Candidates are not locked, only chosen ones are locked by locked_packing
+    return Order.objects.filter(done=False, assigned_to__isnull=True, region__in=courier.regions,
+                                weight__lt=(space + 1) / 100).filter(Exists(windows)).order_by('-weight', 'order_id')
+
+
+def indexed_candidate_orders(courier, space):
+    """
+    The same orders as candidate_orders proposed by the in-process index or None while it's not built, orders taken
+    by others since the index was updated are dropped by the check in database
+    """
+    index = order_index.get()
+    if index is None:
+        return None
+    if space <= 0:
+        return []
+    order_ids = index.candidates(courier.regions, courier.working_hours, space)
+    free = Order.objects.filter(order_id__in=order_ids, done=False, assigned_to__isnull=True).in_bulk()
+    return [free[order_id] for order_id in order_ids if order_id in free]
 
 
 def complete_order(request):
@@ -223,38 +460,116 @@ def complete_order(request):
     return HttpResponseBadRequest('should be POST request with body')
 
 
+def complete_orders_batch(request):
+    """
+    Marking many orders as completed at once, either all of them or none. Orders that are already completed are
+    answered as completed again, so client could safely resend records after reconnecting
+    """
+    if request.method == 'POST' and request.body is not None:
+        try:
+            json = JSONParser().parse(request)
+        except ParseError:
+            return JsonResponse({'validation_error': 'Impossible to parse to JSON'}, status=400)
+        records = json.get('data') if isinstance(json, dict) else None
+        if not isinstance(json, dict) or list(json.keys()) != ['data'] or not isinstance(records, list) or \
+                len(records) == 0:
+            return HttpResponseBadRequest('Json should have only data field with list of completions')
+        error_list, completions = completion_records(records)
+        if len(error_list) == 0:
+            error_list = validated_complete_batch(completions)
+        if len(error_list) != 0:
+            return JsonResponse({'validation_error': {'orders': error_list}}, status=400)
+        return JsonResponse({'orders': [{'order_id': order_id} for order_id in completions]}, status=200)
+    return HttpResponseBadRequest('should be POST request with body')
+
+
+def completion_records(records):
+    """
+    Checks format of completion records and returns errors and complete times by order ids
+    """
+    error_list = []
+    completions = {}
+    for record in records:
+        order_id = record.get('order_id') if isinstance(record, dict) else None
+        try:
+            if not isinstance(record, dict) or sorted(record.keys()) != ['complete_time', 'courier_id', 'order_id']:
+                raise ValueError('Record should have only courier_id, order_id and complete_time fields')
+            if type(order_id) is not int or type(record['courier_id']) is not int:
+                raise ValueError('Ids of courier and order should be integers')
+            if order_id in completions:
+                raise ValueError('Order is completed twice')
+            if not isinstance(record['complete_time'], str):
+                raise ValueError('Complete time is not in a correct format')
+            try:
+                completions[order_id] = (record['courier_id'], isoparse(record['complete_time']).astimezone(UTC))
+            except (ValueError, OverflowError):
+                raise ValueError('Complete time is not in a correct format')
+        except ValueError as error:
+            error_list.append({'id': ['' if order_id is None else order_id, str(error)]})
+    return error_list, completions
+
+
+def validated_complete_batch(completions):
+    """
+    Checks that every order is assigned to its courier with one query and completes open ones with one update of
+    orders and one update of earnings of their couriers
+    """
+    with transaction.atomic():
+        # Couriers are locked before their orders like in assignment and update of courier, both in order of ids so
+        # concurrent batches can't deadlock on them
+        list(Courier.objects.select_for_update().filter(
+            courier_id__in=set(courier_id for courier_id, _ in completions.values())).order_by('courier_id'))
+        orders = {order.order_id: order for order in Order.objects.select_for_update(of=('self',)).select_related(
+            'assigned_to').filter(order_id__in=list(completions)).order_by('order_id')}
+        error_list = []
+        for order_id, (courier_id, _) in completions.items():
+            if order_id not in orders:
+                error_list.append({'id': [order_id, 'No such order']})
+            elif orders[order_id].assigned_to_id != courier_id:
+                error_list.append({'id': [order_id, 'Order assigned to different courier']})
+        if len(error_list) != 0:
+            return error_list
+        completed = [orders[order_id] for order_id in completions if not orders[order_id].done]
+        if len(completed) == 0:
+            return []
+        for order in completed:
+            order.done = True
+            order.complete_time = completions[order.order_id][1]
+        Order.objects.filter(order_id__in=[order.order_id for order in completed]).update(
+            done=True, complete_time=Case(*[When(order_id=order.order_id, then=Value(order.complete_time))
+                                            for order in completed], output_field=DateTimeField()))
+        earnings = {}
+        for order in completed:
+            earnings[order.assigned_to_id] = earnings.get(order.assigned_to_id, 0) + \
+                earning(order.assigned_to.courier_type)
+        Courier.objects.filter(courier_id__in=list(earnings)).update(
+            earnings=F('earnings') + Case(*[When(courier_id=courier_id, then=Value(amount))
+                                            for courier_id, amount in earnings.items()], output_field=IntegerField()))
+        DeliveryStats.add(*completed)
+        AssignmentBatch.remove(completed)
+        metrics.count_orders('completed', len(completed))
+        for courier_id in earnings:
+            cache.invalidate(courier_id)
+    return []
+
+
 def see_courier(courier_id):
-    if len(Courier.objects.filter(courier_id=courier_id)) == 0:
+    """
+    Info about courier with rating built from running totals of completed orders in each region of courier
+    """
+    courier = Courier.objects.filter(courier_id=courier_id).first()
+    if courier is None:
         return HttpResponseNotFound('Not found')
-    courier = Courier.objects.filter(courier_id=courier_id)[0]
-    if len(Order.objects.filter(assigned_to=courier).filter(done=True)) == 0:
-        answer = {
-            "courier_id": courier.courier_id,
-            "courier_type": courier.courier_type,
-            "regions": courier.regions,
-            "working_hours": courier.working_hours,
-            "earnings": courier.earnings
-        }
-        return JsonResponse(answer, status=200)
-    time_by_reg = []
-    for region in courier.regions:
-        orders = Order.objects.filter(region=region).filter(done=True).filter(assigned_to=courier).order_by(
-            'complete_time')
-        if len(orders) != 0:
-            sum_sec = 0
-            for i in range(len(orders)):
-                if i == 0:
-                    sum_sec += (orders[i].complete_time - orders[i].assign_time).total_seconds()
-                else:
-                    sum_sec += (orders[i].complete_time - orders[i - 1].complete_time).total_seconds()
-            time_by_reg.append(sum_sec / len(orders))
-    t = min(time_by_reg)
     answer = {
         "courier_id": courier.courier_id,
         "courier_type": courier.courier_type,
         "regions": courier.regions,
-        "working_hours": courier.working_hours,
-        "rating": round((60 * 60 - min(t, 60 * 60)) / (60 * 60) * 5, 2),
-        "earnings": courier.earnings
+        "working_hours": courier.working_hours
     }
+    time_by_reg = [stats.seconds / stats.count for stats in
+                   DeliveryStats.objects.filter(courier=courier, region__in=courier.regions, count__gt=0)]
+    if len(time_by_reg) != 0:
+        t = min(time_by_reg)
+        answer["rating"] = round((60 * 60 - min(t, 60 * 60)) / (60 * 60) * 5, 2)
+    answer["earnings"] = courier.earnings
     return JsonResponse(answer, status=200)
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RESTCouriers.settings')
+os.environ.setdefault('ASYNC_API', '1')
 
-application = get_asgi_application()
+# The same setup as get_asgi_application() does, the handler streams responses of async views without blocking
+django.setup(set_prefix=False)
+
+from API.async_views import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
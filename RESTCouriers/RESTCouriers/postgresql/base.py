@@ -0,0 +1,137 @@
+"""
+PostgreSQL backend with connection health checks and an optional in-process pool of connections.
+
+HEALTH_CHECKS of database settings makes the first use of a persistent connection in every request check that the
+connection is alive, dead one is replaced instead of failing the request. POOL_SIZE above zero makes closed
+connections go back to a pool shared by all threads of the process, both WSGI workers and threads of async views
+take connections from it. Request waits POOL_TIMEOUT seconds for a free connection.
+"""
+import threading
+import psycopg2
+import psycopg2.extras
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    At most size connections opened on demand, returned ones are kept for reuse and request waits for a free one
+    instead of failing at once. psycopg2 pools close every returned connection above their minimum, and a minimum of
+    size would open all of them at start
+    """
+    def __init__(self, size, conn_params):
+        self.free = threading.BoundedSemaphore(size)
+        self.idle = []
+        self.lock = threading.Lock()
+        self.conn_params = conn_params
+
+    def get(self, timeout):
+        """
+        Connection and whether it was used before
+        """
+        if not self.free.acquire(timeout=timeout):
+            raise OperationalError('No free database connection in the pool for {0} seconds'.format(timeout))
+        with self.lock:
+            if len(self.idle) != 0:
+                return self.idle.pop(), True
+        try:
+            return psycopg2.connect(**self.conn_params), False
+        except Exception:
+            self.free.release()
+            raise
+
+    def put(self, connection, close=False):
+        try:
+            if close:
+                if connection.closed == 0:
+                    connection.close()
+            else:
+                with self.lock:
+                    self.idle.append(connection)
+        finally:
+            self.free.release()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE', 0)
+        if size <= 0:
+            return None
+        with pools_lock:
+            if self.alias not in pools:
+                pools[self.alias] = ConnectionPool(size, self.get_connection_params())
+            return pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            connection = super().get_new_connection(conn_params)
+        else:
+            connection = self.get_pooled_connection()
+        self.health_check_done = True
+        return connection
+
+    def get_pooled_connection(self):
+        while True:
+            connection, reused = self.pool.get(self.settings_dict.get('POOL_TIMEOUT', 30))
+            # Only connections that waited in the pool may have died, new ones are used as they are
+            if not reused or connection.closed == 0 and (not self.settings_dict.get('HEALTH_CHECKS') or
+                                                         self.connection_is_alive(connection)):
+                break
+            self.pool.put(connection, close=True)
+        # The same preparation as for a new connection of the stock backend
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    @staticmethod
+    def connection_is_alive(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # Probe of a connection outside of autocommit mode opens a transaction, Django can't set up the session
+            # inside it
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        # Connection goes back to the pool clean, broken one is dropped
+        try:
+            if not self.connection.autocommit:
+                self.connection.rollback()
+            broken = self.connection.closed != 0
+        except psycopg2.Error:
+            broken = True
+        self.pool.put(self.connection, close=broken)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called when request starts and finishes, so connection is checked once per request
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if self.connection is not None and self.settings_dict.get('HEALTH_CHECKS') and \
+                not self.health_check_done and not self.in_atomic_block:
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
@@ -43,10 +43,11 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'API'
+    'API.apps.ApiConfig'
 ]
 
 MIDDLEWARE = [
+    'API.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,17 +80,119 @@ WSGI_APPLICATION = 'RESTCouriers.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Connections live CONN_MAX_AGE seconds and are checked once per request if CONN_HEALTH_CHECKS is set. With
+# DB_POOL_SIZE above zero connections are returned to an in-process pool after every request instead
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'RESTCouriers.postgresql',
         'NAME': os.getenv('NAME'),
         'USER': os.getenv('USER'),
         'PASSWORD': os.getenv('PASSWORD'),
         'HOST': os.getenv('HOST'),
         'PORT': os.getenv('PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.getenv('CONN_MAX_AGE', 60)),
+        'HEALTH_CHECKS': os.getenv('CONN_HEALTH_CHECKS', '1') == '1',
+        'POOL_SIZE': DB_POOL_SIZE,
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }
+}
+
+# Cache of courier profiles, local memory one is enough for a single process but several workers need a shared
+# backend such as memcached or file based one
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# Courier profiles are cached and Idempotency-Key is served only by a cache that all processes of the server share,
+# local memory cache counts as shared only when the server runs a single process (SINGLE_PROCESS=1)
+SHARED_CACHE = CACHE_BACKEND != 'django.core.cache.backends.locmem.LocMemCache' or os.getenv('SINGLE_PROCESS') == '1'
+
+# Seconds courier profile stays in cache
+COURIER_CACHE_TIMEOUT = int(os.getenv('COURIER_CACHE_TIMEOUT', 300))
+
+# Number of rows written by one INSERT when couriers and orders are uploaded
+UPLOAD_BATCH_SIZE = int(os.getenv('UPLOAD_BATCH_SIZE', 1000))
+
+# Packing strategy for every type of courier, one of API.allocation.SOLVERS. numpy is not in requirements.txt, without
+# it the numpy strategy runs as bitset and the API.W002 check warns about it
+ALLOCATION_STRATEGIES = {
+    'foot': os.getenv('ALLOCATION_FOOT', 'bitset'),
+    'bike': os.getenv('ALLOCATION_BIKE', 'bitset'),
+    'car': os.getenv('ALLOCATION_CAR', 'bitset'),
+}
+
+# Seconds the bounded strategy may spend on exact solution before falling back to greedy one
+ALLOCATION_TIME_BUDGET = float(os.getenv('ALLOCATION_TIME_BUDGET', 0.5))
+
+# Packing problems of at least SOLVER_POOL_MIN_CELLS orders x free space cells are solved by SOLVER_POOL_SIZE worker
+# processes, answer that is not ready in SOLVER_DEADLINE seconds is replaced with a greedy one. Zero pool size keeps
+# solving in the request thread
+SOLVER_POOL_SIZE = int(os.getenv('SOLVER_POOL_SIZE', 0))
+SOLVER_POOL_MIN_CELLS = int(os.getenv('SOLVER_POOL_MIN_CELLS', 1000000))
+SOLVER_DEADLINE = float(os.getenv('SOLVER_DEADLINE', 1.0))
+
+# Exact packing in the request process keeps rows of the last problem of every set of regions and working hours for
+# any free space and solves the next one from them, rows of least recently used sets are dropped above
+# KNAPSACK_CACHE_BYTES, 0 turns reuse off. It pays off while backlog changes slowly, assignment takes the heaviest
+# orders, which are the start of the rows (see bench_knapsack_reuse command)
+KNAPSACK_CACHE_BYTES = int(os.getenv('KNAPSACK_CACHE_BYTES', 16 * 1024 * 1024))
+
+# Async views are served when the app runs under ASGI, their work is done by a pool of ASYNC_POOL_SIZE threads
+# each holding one database connection
+ASYNC_API = os.getenv('ASYNC_API') == '1'
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 10))
+
+# Requests are sampled with probability INSTRUMENTATION_SAMPLE_RATE when they start, sampled ones slower than
+# INSTRUMENTATION_SLOW_MS milliseconds get their first 200 queries logged. Other requests keep only counters
+INSTRUMENTATION_SLOW_MS = float(os.getenv('INSTRUMENTATION_SLOW_MS', 500))
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'API': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# In-process index of orders waiting for assignment used by assign_orders instead of the database search. Changes of
+# all processes come to it with LISTEN/NOTIFY, its listener checks the connection after ORDER_INDEX_PING seconds
+# without notifications
+ORDER_INDEX = os.getenv('ORDER_INDEX') == '1'
+ORDER_INDEX_PING = float(os.getenv('ORDER_INDEX_PING', 30))
+
+# GET /couriers and GET /orders give LIST_LIMIT rows per page by default and at most LIST_MAX_LIMIT, NDJSON export reads
+# LIST_CHUNK_SIZE rows at once from server side cursor
+LIST_LIMIT = int(os.getenv('LIST_LIMIT', 100))
+LIST_MAX_LIMIT = int(os.getenv('LIST_MAX_LIMIT', 1000))
+LIST_CHUNK_SIZE = int(os.getenv('LIST_CHUNK_SIZE', 2000))
+
+# Responses of POST requests with Idempotency-Key header are kept IDEMPOTENCY_TTL seconds unless they are longer than
+# IDEMPOTENCY_MAX_BYTES, repeated request waits for the first one IDEMPOTENCY_WAIT seconds. The first request prolongs
+# its lock of the key while it runs, the lock of a request whose worker died expires in IDEMPOTENCY_LOCK_TIMEOUT seconds
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_MAX_BYTES = int(os.getenv('IDEMPOTENCY_MAX_BYTES', 1024 * 1024))
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', 30))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 120))
+
+# Assignment claims offers packed in advance by run_dispatcher command, jobs for it are enqueued by uploads of orders
+# and changes of couriers
+DISPATCHER = os.getenv('DISPATCHER') == '1'
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
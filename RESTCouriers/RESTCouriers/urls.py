@@ -15,8 +15,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from API import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics.export),
     path('', include('API.urls'))
 ]